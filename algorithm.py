@@ -1,350 +1,1345 @@
 import argparse
+import hashlib
+import json
 import networkx as nx
+import numpy as np
 import os
 import shutil
+import time
 
-from collections import Counter
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
-from math import inf, floor, exp
-from os.path import isfile, join
-from pulp import LpProblem, LpMaximize, LpVariable, lpSum
+from itertools import groupby
+from math import inf
+from os.path import dirname, isfile, join
+from pulp import (
+    LpAffineExpression,
+    LpProblem,
+    LpMaximize,
+    LpStatus,
+    LpVariable,
+    PULP_CBC_CMD,
+    lpSum,
+)
+from scipy.sparse import coo_matrix
 
-from constants import ALLOWED_TOPOLOGIES, ALLOWED_VARIANTS, MWU_FACTOR, GAMMA, RHO2
+from array_substrate import ArraySubstrate
+from constants import (
+    ALLOWED_ENGINES,
+    ALLOWED_LAYOUTS,
+    ALLOWED_TOPOLOGIES,
+    ALLOWED_VARIANTS,
+    ALLOWED_WORKLOAD_TYPES,
+    BOUND_TOLERANCE,
+    CG_MAX_ITERATIONS,
+    CG_PRICE_SCALE,
+    CG_TIE_BREAK,
+    CG_TOLERANCE,
+    MWU_FACTOR,
+    GAMMA,
+    INTERNET_DIR,
+    LAYOUT_CACHE_DIR,
+    RHO2,
+)
+from flow_engines import get_engine
+from flow_network import FlowNetwork
 from helpers import (
     DrawGraphs,
+    finish_rendering,
     from_min_cost_flow,
-    save_flow_details,
-    upload_to_google_drive,
     get_google_drive_folder_id,
 )
+from lower_bounds import source_distances, source_lower_bounds
+from mapping import ServerPaths, WorkloadMapper
+from mapping_cache import MappingCache
+from profiler import profiler
+from results_writer import ResultsWriter
+from shortest_paths import ShortestPathIndex
+from storage import GoogleDriveStorage, LocalStorage, upload_directory
 from substrate import (
+    file_digest,
+    get_rng,
     generate_random_graph,
-    generate_internet_topology_graph,
+    load_internet_topology_graph,
     generate_bcube_topology_graph,
     generate_clos_topology_graph,
     generate_xpander_topology_graph,
 )
 from workload import generate_workload
+from workload_trace import (
+    ARRIVAL,
+    scan_workload_trace,
+    sorted_workload_trace,
+    workload_events,
+)
 
 
-def add_sink_node(flow_graph, substrate_graph, source, node_demand, current_time):
-    flow_graph.add_node("sink", demand=node_demand)
-    substrate_nodes = dict(substrate_graph.nodes(data=True))
-    for u in flow_graph.nodes():
-        if u == "sink" or substrate_graph.nodes().get(u, {}).get("is_switch", False):
-            continue
-        data = substrate_nodes.get(u, {})
-        if u == "source":
-            data = substrate_nodes.get(source, {})
-            data.update({"capacity": data.get("capacity", 1) - 1})
-            # data.update({"capacity": 0}) # source-sink capacity set to 0 to avoid trivial path
-        data.update({"capacity": data.get("capacity", 0) - data["load"][current_time]})
-        flow_graph.add_edge(u, "sink", **data)
-    return flow_graph
-
-
-def generate_network_flow(graph, source, node_demand, edge_demand, current_time):
-    G = nx.DiGraph()
-    for u, values in graph.nodes(data=True):
-        if values.get("is_switch"):
-            G.add_node(u, is_switch=True)
-        else:
-            G.add_node(u)
-    for u, v, kwargs in graph.edges(data=True):
-        kwargs.update(
-            {
-                "capacity": floor(
-                    (kwargs.get("capacity", 0) - kwargs["load"][current_time])
-                    / edge_demand
-                )
-            }
-        )
-        if source != v:
-            G.add_edge(u, v, **kwargs)
-        if source != u:
-            G.add_edge(v, u, **kwargs)
-    G.nodes().get(source).update({"demand": node_demand})
-    G = nx.relabel_nodes(G, {source: "source"})
-    return G
-
-
-def update_flow_graph(graph, source):
+def update_flow_graph(graph):
     for u, v, values in graph.edges(data=True):
         if v == "sink":
             graph.nodes().get(u).update(values)
     graph.remove_node("sink")
-    graph = nx.relabel_nodes(graph, {"source": source})
     return graph
 
 
-def fetch_all_mappings(substrate_graph, flow, edge_demand, current_time):
-    all_mappings = list()
-    for source in list(substrate_graph.nodes()):
-        if substrate_graph.nodes().get(source).get("is_switch", False):
-            continue
-        network_flow_graph = generate_network_flow(
-            substrate_graph, source, -flow, edge_demand, current_time
-        )
-        network_flow_graph = add_sink_node(
-            network_flow_graph, substrate_graph, source, flow, current_time
+@profiler.timed("flow_network")
+def get_flow_network(substrate, edge_demand, current_time, network=None):
+    if network is None:
+        return FlowNetwork(substrate, edge_demand, current_time)
+    network.refresh(substrate)
+    return network
+
+
+def map_source(network, source, flow, engine="networkx", index=None):
+    network.rebind(source, flow)
+    # if network.graph.get_edge_data(source, "sink").get("capacity", 0) >= flow:
+    #     print("Encountered trivial case.")
+    #     return None
+    try:
+        flow_dict = None
+        if index:
+            # Shortest path trees are enough unless an edge capacity binds
+            with profiler.phase("shortest_path_index"):
+                flow_dict = index.route(network)
+        if flow_dict is None:
+            # Counted before solving, infeasible solves are solves too
+            profiler.count("solves")
+            with profiler.phase("min_cost_flow"):
+                flow_dict = get_engine(engine).solve(network)
+        else:
+            profiler.count("fast_paths")
+        with profiler.phase("from_min_cost_flow"):
+            flow_graph, cost = from_min_cost_flow(flow_dict, network.graph)
+            flow_graph = update_flow_graph(flow_graph)
+        return flow_graph, cost, source
+    except nx.exception.NetworkXUnfeasible:
+        # No path found.
+        profiler.count("infeasible_sources")
+        return None
+
+
+# Flow network shared by the per-source solves of a worker process
+worker_state = dict()
+
+
+def init_mapping_worker(network, engine, index=None):
+    worker_state.update({"network": network, "engine": engine, "index": index})
+
+
+def map_sources_in_worker(arc_state, flow, sources):
+    # Updates the worker's network to the parent's residual capacities and weights
+    # before solving the chunk
+    network = worker_state["network"]
+    network.update(*arc_state)
+    index = worker_state["index"]
+    if index:
+        index.refresh(network.edge_weight)
+    return [
+        map_source(network, source, flow, worker_state["engine"], index)
+        for source in sources
+    ]
+
+
+def get_worker_count(workers):
+    if not workers or workers < 1:
+        return os.cpu_count() or 1
+    return workers
+
+
+class MappingPool:
+    """
+    Worker processes solving the per-source min cost flows, kept for a whole run.
+    Workers get a copy of the flow network when the pool starts, every batch of
+    sources then only carries the residual capacities and weights of its arcs. The
+    processes are only restarted when the network layout, engine or index changes.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.executor = None
+        self.template = None
+        self.arc_tails = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def start(self, network, engine, index=None):
+        template = (network.nodes, engine, index)
+        if (
+            self.executor
+            and self.template == template
+            and np.array_equal(self.arc_tails, network.arc_tails)
+        ):
+            return
+        self.close()
+        # Network is shipped once per worker
+        network.unbind()
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=init_mapping_worker,
+            initargs=(network, engine, index),
         )
-        # if network_flow_graph.get_edge_data(source, "sink").get("capacity", 0)-1 >= flow:
-        #     print("Encountered trivial case.")
-        #     continue
-        try:
-            flow_dict = nx.min_cost_flow(network_flow_graph)
-            flow_graph, cost = from_min_cost_flow(flow_dict, network_flow_graph)
-            flow_graph = update_flow_graph(flow_graph, source)
-            all_mappings.append((network_flow_graph, flow_graph, cost, source))
-        except nx.exception.NetworkXUnfeasible:
-            # No path found.
-            pass
-    return all_mappings
-
-
-def min_congestion(substrate_graph, flow, edge_demand, current_time):
+        self.template = template
+        self.arc_tails = network.arc_tails
+
+    def map(self, network, sources, flow, engine="networkx", index=None):
+        # Results keep source order
+        self.start(network, engine, index)
+        chunksize = max(1, len(sources) // (4 * self.workers))
+        chunks = [sources[i : i + chunksize] for i in range(0, len(sources), chunksize)]
+        arc_state = network.arc_state()
+        return [
+            mapping
+            for chunk in self.executor.map(
+                map_sources_in_worker,
+                [arc_state] * len(chunks),
+                [flow] * len(chunks),
+                chunks,
+            )
+            for mapping in chunk
+        ]
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown()
+        self.executor = None
+        self.template = None
+        self.arc_tails = None
+
+
+def map_sources(network, sources, flow, engine="networkx", pool=None, index=None):
+    # Results keep source order
+    if not pool:
+        return [map_source(network, source, flow, engine, index) for source in sources]
+    return pool.map(network, sources, flow, engine, index)
+
+
+def fetch_all_mappings(
+    substrate,
+    flow,
+    edge_demand,
+    current_time,
+    workers=1,
+    network=None,
+    engine="networkx",
+    index=None,
+    pool=None,
+):
+    network = get_flow_network(substrate, edge_demand, current_time, network)
+    if index:
+        index.refresh(network.edge_weight)
+    sources = substrate.servers()
+    workers = min(get_worker_count(workers), len(sources))
+    if pool:
+        mappings = map_sources(network, sources, flow, engine, pool, index)
+    elif workers <= 1:
+        mappings = map_sources(network, sources, flow, engine, index=index)
+    else:
+        with MappingPool(workers) as pool:
+            mappings = map_sources(network, sources, flow, engine, pool, index)
+    return [mapping for mapping in mappings if mapping]
+
+
+def fetch_pruned_mappings(
+    substrate,
+    flow,
+    edge_demand,
+    current_time,
+    workers=1,
+    network=None,
+    engine="networkx",
+    distances=None,
+    index=None,
+    pool=None,
+):
+    """
+    Branch and bound over the candidate sources. Sources are solved in lower bound
+    order and skipped once their bound shows they can't beat (or, being later in
+    source order, tie) the best cost found so far. The minimum over the returned
+    mappings is the same as over fetch_all_mappings.
+    """
+    network = get_flow_network(substrate, edge_demand, current_time, network)
+    if index:
+        index.refresh(network.edge_weight)
+    sources = substrate.servers()
+    with profiler.phase("lower_bounds"):
+        bounds = source_lower_bounds(network, flow, distances).tolist()
+    candidates = sorted((bound, i) for i, bound in enumerate(bounds) if bound < inf)
+    workers = min(get_worker_count(workers), max(len(candidates), 1))
+    # Pools of a run outlive the call, a pool of its own is closed afterwards
+    own_pool = MappingPool(workers) if not pool and workers > 1 else None
+    pool = pool or own_pool
+    if pool:
+        workers = pool.workers
+    mappings = list()
+    min_cost, min_index = inf, inf
+    position = 0
+    solved = 0
+    try:
+        while position < len(candidates):
+            batch = list()
+            while position < len(candidates) and len(batch) < workers:
+                bound, i = candidates[position]
+                slack = BOUND_TOLERANCE * max(1, abs(min_cost))
+                if bound > min_cost + slack:
+                    # Candidates are sorted, none of the remaining can do better
+                    position = len(candidates)
+                    break
+                position += 1
+                if bound >= min_cost - slack and i > min_index:
+                    continue
+                batch.append(i)
+            solved += len(batch)
+            batch_mappings = map_sources(
+                network,
+                [sources[i] for i in batch],
+                flow,
+                engine,
+                pool,
+                index,
+            )
+            for i, mapping in zip(batch, batch_mappings):
+                if not mapping:
+                    continue
+                mappings.append((i, mapping))
+                cost = mapping[1]
+                if cost < min_cost or (cost == min_cost and i < min_index):
+                    min_cost, min_index = cost, i
+    finally:
+        if own_pool:
+            own_pool.close()
+    profiler.count("pruned_sources", len(sources) - solved)
+    return [mapping for _, mapping in sorted(mappings, key=lambda m: m[0])]
+
+
+def fetch_cached_mappings(
+    substrate,
+    flow,
+    edge_demand,
+    current_time,
+    workers=1,
+    network=None,
+    engine="networkx",
+    prune=False,
+    cache=None,
+    distances=None,
+    index=None,
+    pool=None,
+):
+    network = get_flow_network(substrate, edge_demand, current_time, network)
+    fetch_mappings = fetch_pruned_mappings if prune else fetch_all_mappings
+    key = None
+    if cache is not None:
+        key = cache.key(network, flow, fetch_mappings.__name__, engine, bool(index))
+        mappings = cache.get(key)
+        if mappings is not None:
+            profiler.count("cache_hits")
+            return mappings
+        profiler.count("cache_misses")
+    options = {"index": index, "pool": pool}
+    if prune:
+        options.update({"distances": distances})
+    mappings = fetch_mappings(
+        substrate, flow, edge_demand, current_time, workers, network, engine, **options
+    )
+    if key:
+        cache.put(key, mappings)
+    return mappings
+
+
+def min_congestion(
+    substrate,
+    flow,
+    edge_demand,
+    current_time,
+    workers=1,
+    network=None,
+    engine="networkx",
+    prune=False,
+    cache=None,
+    distances=None,
+    index=None,
+    snapshot=True,
+    pool=None,
+):
     min_cost = inf
     min_graph = None
     min_source = None
-    min_substrate_graph = substrate_graph
-    all_mappings = fetch_all_mappings(substrate_graph, flow, edge_demand, current_time)
-    for network_flow_graph, flow_graph, cost, source in all_mappings:
+    min_substrate_graph = None
+    network = get_flow_network(substrate, edge_demand, current_time, network)
+    all_mappings = fetch_cached_mappings(
+        substrate,
+        flow,
+        edge_demand,
+        current_time,
+        workers,
+        network,
+        engine,
+        prune,
+        cache,
+        distances,
+        index,
+        pool,
+    )
+    for flow_graph, cost, source in all_mappings:
         if cost < min_cost:
             min_cost = cost
             min_graph = flow_graph
-            min_substrate_graph = network_flow_graph
             min_source = source
-    if min_substrate_graph:
-        min_substrate_graph = nx.relabel_nodes(
-            min_substrate_graph, {"source": f"source_{min_source}"}
-        )
+    if min_graph and snapshot:
+        network.rebind(min_source, flow)
+        min_substrate_graph = network.snapshot()
     return min_substrate_graph, min_graph, min_cost, min_source
 
 
-def get_substrate_graphs(topology):
-    substrate_graphs = list()
+@profiler.timed("workload_mapping")
+def map_workload(substrate, workload_graph, current_time, paths=None):
+    # General workload graphs are mapped heuristically instead of by min cost flow
+    return WorkloadMapper(substrate, current_time, paths).map(workload_graph)
+
+
+def get_substrate_titles(topology):
     if topology == "internet":
-        dir_path = "dataset/internet"
-        internet_toplogy_files = [
+        return sorted(
             f
-            for f in os.listdir(dir_path)
-            if isfile(join(dir_path, f)) and f.endswith(".graphml")
-        ]
-        for file_name in internet_toplogy_files:
-            substrate_graphs.append(
-                (
-                    f"{file_name}",
-                    generate_internet_topology_graph(join(dir_path, file_name)),
-                )
-            )
-    elif topology == "clos":
-        substrate_graphs.append((f"clos", generate_clos_topology_graph()))
-    elif topology == "bcube":
-        substrate_graphs.append((f"bcube", generate_bcube_topology_graph()))
-    elif topology == "xpander":
-        substrate_graphs.append((f"xpander", generate_xpander_topology_graph()))
-    elif topology == "random":
-        substrate_graphs.append((f"random", generate_random_graph()))
-    else:
-        print(f"We don't support {topology} topology right now.")
-    return substrate_graphs
+            for f in os.listdir(INTERNET_DIR)
+            if isfile(join(INTERNET_DIR, f)) and f.endswith(".graphml")
+        )
+    if topology in ["clos", "bcube", "xpander", "random"]:
+        return [topology]
+    print(f"We don't support {topology} topology right now.")
+    return list()
+
+
+def get_substrate_graph(topology, title, seed=None):
+    if topology == "internet":
+        return load_internet_topology_graph(join(INTERNET_DIR, title))
+    if topology == "clos":
+        return generate_clos_topology_graph(seed=seed)
+    if topology == "bcube":
+        return generate_bcube_topology_graph(seed=seed)
+    if topology == "xpander":
+        return generate_xpander_topology_graph(seed=seed)
+    if topology == "random":
+        return generate_random_graph(seed=seed)
+    return None
+
+
+def get_substrate_graphs(topology, seed=None):
+    return [
+        (title, get_substrate_graph(topology, title, seed))
+        for title in get_substrate_titles(topology)
+    ]
+
+
+def calculate_load_factors(capacities, loads):
+    # Load factors of all resources at once, loads is the (resources x time) window
+    deno = RHO2 * capacities
+    return np.exp(loads * GAMMA / deno[:, None]).sum(axis=1)
 
 
-def calculate_weight(values, start_time, end_time):
-    load_factor = 0
-    deno = RHO2 * values.get("capacity")
-    for time in range(start_time, end_time + 1):
-        load_factor += exp((values.get("load")[time] * GAMMA) / deno)
+def calculate_weights(capacities, load_factors, slot_count=1):
+    # Every slot of the load window stands for slot_count slots of the workload's
+    # duration
+    weights = (GAMMA * slot_count * load_factors) / (RHO2 * capacities)
     # Since min_cost_flow doesn't work on proper fraction weight
-    weight = (GAMMA * load_factor) / deno
-    if weight < 1:
-        weight = 0
-    return weight
+    weights[weights < 1] = 0
+    return weights
 
 
-def update_weight(graph, min_graph, start_time, end_time, variant="default"):
+@profiler.timed("weights")
+def update_weight(
+    substrate,
+    min_graph,
+    start_time,
+    end_time,
+    variant="default",
+    incremental=False,
+    slot_count=1,
+):
     if variant == "default" and min_graph:
-        for u, v, values in min_graph.edges(data=True):
-            edge = graph.edges()[u, v]
-            edge.update({"weight": edge.get("weight", 0) * (1 + MWU_FACTOR)})
-        for u, values in min_graph.nodes(data=True):
-            if values.get("load", 0) == 0:
+        for u, v in min_graph.edges():
+            substrate.edge_weight[substrate.edge_id(u, v)] *= 1 + MWU_FACTOR
+        for u, load in min_graph.nodes(data="load", default=0):
+            if load == 0:
                 continue
-            node = graph.nodes().get(u)
-            node.update({"weight": node.get("weight", 0) * (1 + MWU_FACTOR)})
+            substrate.node_weight[substrate.node_index[u]] *= 1 + MWU_FACTOR
     elif variant == "online":
-        for _, _, values in graph.edges(data=True):
-            values.update({"weight": calculate_weight(values, start_time, end_time)})
-        for _, values in graph.nodes(data=True):
-            values.update({"weight": calculate_weight(values, start_time, end_time)})
+        # Incremental updates only recompute the load factors of resources whose
+        # load changed, which is exact as long as the time window stays the same.
+        # The slot count only scales them, a new one rescales every weight without
+        # recomputing the load factors
+        window = (start_time, end_time)
+        incremental = incremental and substrate.weight_window == window
+        rescale = not incremental or substrate.weight_slot_count != slot_count
+        substrate.weight_window = window
+        substrate.weight_slot_count = slot_count
+        for capacities, weights, load_factors, load in [
+            (
+                substrate.edge_capacity,
+                substrate.edge_weight,
+                substrate.edge_load_factor,
+                substrate.edge_load,
+            ),
+            (
+                substrate.node_capacity,
+                substrate.node_weight,
+                substrate.node_load_factor,
+                substrate.node_load,
+            ),
+        ]:
+            changed = load.pop_changed()
+            rows = changed if incremental else np.arange(len(weights))
+            if len(rows):
+                load_factors[rows] = calculate_load_factors(
+                    capacities[rows], load.window(start_time, end_time, rows)
+                )
+            if rescale:
+                rows = np.arange(len(weights))
+            if len(rows):
+                weights[rows] = calculate_weights(
+                    capacities[rows], load_factors[rows], slot_count
+                )
+
+
+def placement_record(substrate, min_graph):
+    # Loaded resources of a mapping as (edge rows, edge loads, node rows, node loads)
+    edges = list(min_graph.edges(data="load", default=0))
+    nodes = list(min_graph.nodes(data="load", default=0))
+    return (
+        np.array([substrate.edge_id(u, v) for u, v, _ in edges], dtype=np.int64),
+        np.array([load for _, _, load in edges]),
+        np.array([substrate.node_index[u] for u, _ in nodes], dtype=np.int64),
+        np.array([load for _, load in nodes]),
+    )
+
+
+def apply_placement(substrate, record, start_time, end_time, sign=1):
+    edge_rows, edge_loads, node_rows, node_loads = record
+    substrate.edge_load.add(edge_rows, start_time, end_time, sign * edge_loads)
+    substrate.node_load.add(node_rows, start_time, end_time, sign * node_loads)
 
 
-def update_load(graph, min_graph, start_time, end_time):
+@profiler.timed("loads")
+def update_load(substrate, min_graph, start_time, end_time):
     if not min_graph:
-        return
-    for u, v, values in min_graph.edges(data=True):
-        for time in range(start_time, end_time + 1):
-            edge = graph.edges()[u, v]
-            edge.get("load")[time] += values.get("load", 0)
-    for u, values in min_graph.nodes(data=True):
-        for time in range(start_time, end_time + 1):
-            load = graph.nodes().get(u)["load"]
-            load[time] += values.get("load", 0)
-
-
-def solve_lp(graph, workload_map, algo_end_time):
-    obj = list()
-    variables = dict()
+        return None
+    record = placement_record(substrate, min_graph)
+    apply_placement(substrate, record, start_time, end_time)
+    return record
+
+
+@profiler.timed("loads")
+def release_load(substrate, record, time):
+    # Departure of a workload, O(mapping size) on the event driven substrate
+    apply_placement(substrate, record, time, time, sign=-1)
+
+
+def placement_congestion(substrate, record, time):
+    # Loads only grow on the placed resources, enough to keep a running peak
+    edge_rows, _, node_rows, _ = record
+    congestion = 0
+    if len(edge_rows):
+        edge_congestion = (
+            substrate.edge_load.at(time)[edge_rows] / substrate.edge_capacity[edge_rows]
+        )
+        congestion = max(congestion, edge_congestion.max().item())
+    if len(node_rows):
+        node_congestion = (
+            substrate.node_load.at(time)[node_rows] / substrate.node_capacity[node_rows]
+        )
+        congestion = max(congestion, node_congestion.max().item())
+    return congestion
+
+
+def mapping_incidence(substrate, mappings):
+    # Sparse (resources x mappings) load matrix, edges first and then nodes
+    rows, columns, loads = list(), list(), list()
+    for column, mapping in enumerate(mappings):
+        for u, v, load in mapping.edges(data="load", default=0):
+            rows.append(substrate.edge_id(u, v))
+            columns.append(column)
+            loads.append(load)
+        for u, load in mapping.nodes(data="load", default=0):
+            if load == 0:
+                continue
+            rows.append(substrate.edge_count + substrate.node_index[u])
+            columns.append(column)
+            loads.append(load)
+    # Both directions of an edge add up on the same resource
+    return coo_matrix(
+        (loads, (rows, columns)),
+        shape=(substrate.edge_count + substrate.node_count, len(mappings)),
+    ).tocsr()
+
+
+def mapping_signature(substrate, mapping):
+    incidence = mapping_incidence(substrate, [mapping]).tocoo()
+    return tuple(sorted(zip(incidence.row.tolist(), incidence.data.tolist())))
+
+
+def resource_name(substrate, resource):
+    if resource < substrate.edge_count:
+        return f"edge_{resource}"
+    return f"node_{resource - substrate.edge_count}"
+
+
+def build_mapping_model(substrate, workload_map, relaxed=False, slack=False):
+    """
+    Model choosing one mapping per workload under the substrate capacities. The
+    relaxed model has continuous variables, slack lets a workload stay unmapped so
+    the model is always feasible (as needed by a restricted master problem).
+    """
+    variables = list()
+    mappings = list()
     model = LpProblem(name="workload_mapping", sense=LpMaximize)
-    for workload_no, all_mappings in workload_map:
-        mapping_expression = 0
+    for workload_no, (_, all_mappings) in enumerate(workload_map):
+        if not all_mappings:
+            continue
+        mapping_variables = list()
         for mapping_idx, mapping in enumerate(all_mappings):
             e_var = LpVariable(
                 name=f"mapping_{workload_no}_{mapping_idx}",
                 lowBound=0,
                 upBound=1,
-                cat="Integer",
+                cat="Continuous" if relaxed else "Integer",
             )
-            obj.append(e_var)
-            variables.update({f"mapping_{workload_no}_{mapping_idx}": e_var})
-            mapping_expression += e_var
-        model += (mapping_expression == 1, f"cmap_{workload_no}_{mapping_idx}")
-    for u, v, values in graph.edges(data=True):
-        mapping_expression = 0
-        for workload_no, all_mappings in workload_map:
-            for mapping_idx, mapping in enumerate(all_mappings):
-                try:
-                    mapping_expression += mapping.edges()[u, v]["load"] * variables.get(
-                        f"mapping_{workload_no}_{mapping_idx}"
-                    )
-                except:
-                    pass
-        model += (mapping_expression <= values.get("capacity"), f"edge_{u}_{v}")
-    for u, values in graph.nodes(data=True):
-        mapping_expression = 0
-        for workload_no, all_mappings in workload_map:
-            for mapping_idx, mapping in enumerate(all_mappings):
-                try:
-                    mapping_expression += mapping.nodes()[u]["load"] * variables.get(
-                        f"mapping_{workload_no}_{mapping_idx}"
-                    )
-                except:
-                    pass
-        model += (mapping_expression <= values.get("capacity"), f"node_{u}")
-    model += lpSum(obj)
+            mapping_variables.append(e_var)
+            mappings.append(mapping)
+        variables.extend(mapping_variables)
+        mapping_expression = lpSum(mapping_variables)
+        if slack:
+            mapping_expression += LpVariable(name=f"slack_{workload_no}", lowBound=0)
+        model += (mapping_expression == 1, f"cmap_{workload_no}")
+
+    # Only resources used by some mapping get a capacity constraint
+    incidence = mapping_incidence(substrate, mappings)
+    capacities = np.concatenate(
+        (substrate.edge_capacity, substrate.node_capacity)
+    ).tolist()
+    resources = np.flatnonzero(np.diff(incidence.indptr))
+    for resource in resources.tolist():
+        start, end = incidence.indptr[resource], incidence.indptr[resource + 1]
+        mapping_expression = LpAffineExpression(
+            zip(
+                [variables[i] for i in incidence.indices[start:end].tolist()],
+                incidence.data[start:end].tolist(),
+            )
+        )
+        model += (
+            mapping_expression <= capacities[resource],
+            resource_name(substrate, resource),
+        )
+    model += lpSum(variables)
+    return model, variables, mappings, resources
+
+
+@profiler.timed("lp")
+def solve_lp(substrate, workload_map, algo_end_time):
+    for _, all_mappings in workload_map:
+        if not all_mappings:
+            print("Couldn't fit workload in substrate graph.")
+    # Workloads that don't fit together are left out instead of making the model
+    # infeasible, whose values would be meaningless
+    model, variables, mappings, _ = build_mapping_model(
+        substrate, workload_map, slack=True
+    )
+    if not variables:
+        return
+    model.solve()
+    if LpStatus[model.status] != "Optimal":
+        print(f"Offline LP not solved: {LpStatus[model.status]}")
+        return
+
+    placed = set()
+    for var, mapping in zip(variables, mappings):
+        if (var.value() or 0) > 0:
+            placed.add(int(var.name.split("_")[1]))
+            update_load(substrate, mapping, 0, algo_end_time - 1)
+    for workload_no, (_, all_mappings) in enumerate(workload_map):
+        if all_mappings and workload_no not in placed:
+            print("Couldn't fit workload in substrate graph.")
+
+
+@profiler.timed("column_generation")
+def solve_column_generation(
+    substrate,
+    workloads,
+    algo_end_time,
+    workers=1,
+    engine="networkx",
+    prune=False,
+    pool=None,
+):
+    """
+    Offline variant without enumerating every mapping. Each workload starts with
+    its min cost mapping, then the duals of the relaxed restricted master price new
+    mappings through a min cost flow weighted by the resource duals. Only mappings
+    with a positive reduced cost are added, the integer model is solved last.
+    """
+    networks = dict()
+    workload_map = list()
+    for workload_no, (flow, edge_demand, current_time) in enumerate(workloads):
+        key = (edge_demand, current_time)
+        if key not in networks:
+            networks.update(
+                {key: get_flow_network(substrate, edge_demand, current_time)}
+            )
+        _, min_graph, _, _ = min_congestion(
+            substrate,
+            flow,
+            edge_demand,
+            current_time,
+            workers,
+            networks.get(key),
+            engine,
+            prune,
+            pool=pool,
+        )
+        if not min_graph:
+            print("Couldn't fit workload in substrate graph.")
+        workload_map.append((workload_no, [min_graph] if min_graph else []))
+    seen = [
+        {mapping_signature(substrate, mapping) for mapping in all_mappings}
+        for _, all_mappings in workload_map
+    ]
+
+    # Same substrate, weighted by the duals of the resources
+    pricing = substrate.view()
+    networks = dict()
+    for _ in range(CG_MAX_ITERATIONS):
+        model, variables, _, resources = build_mapping_model(
+            substrate, workload_map, relaxed=True, slack=True
+        )
+        if not variables:
+            return
+        model.solve(PULP_CBC_CMD(msg=False))
+        if LpStatus[model.status] != "Optimal":
+            break
+        duals = np.zeros(substrate.edge_count + substrate.node_count)
+        duals[resources] = [
+            max(model.constraints[resource_name(substrate, r)].pi or 0, 0)
+            for r in resources.tolist()
+        ]
+        # Original weights only break ties between equally priced mappings, they
+        # are normalised to at most CG_TIE_BREAK per resource whatever their
+        # magnitude. The weights are scaled and rounded to integers, network
+        # simplex does not reliably terminate on fractional weights
+        original = np.concatenate((substrate.edge_weight, substrate.node_weight))
+        tie_break = CG_TIE_BREAK * original / max(np.abs(original).max(), 1e-12)
+        weights = np.rint(CG_PRICE_SCALE * (duals + tie_break)).astype(np.int64)
+        pricing.edge_weight = weights[: substrate.edge_count]
+        pricing.node_weight = weights[substrate.edge_count :]
+
+        added = 0
+        for workload_no, (flow, edge_demand, current_time) in enumerate(workloads):
+            if not workload_map[workload_no][1]:
+                continue
+            key = (edge_demand, current_time)
+            if key not in networks:
+                networks.update(
+                    {key: get_flow_network(pricing, edge_demand, current_time)}
+                )
+            _, mapping, _, _ = min_congestion(
+                pricing,
+                flow,
+                edge_demand,
+                current_time,
+                workers,
+                networks.get(key),
+                engine,
+                prune,
+                pool=pool,
+            )
+            if not mapping:
+                continue
+            dual_cost = (mapping_incidence(substrate, [mapping]).T @ duals).item()
+            workload_dual = model.constraints[f"cmap_{workload_no}"].pi or 0
+            signature = mapping_signature(substrate, mapping)
+            if (
+                1 - workload_dual - dual_cost > CG_TOLERANCE
+                and signature not in seen[workload_no]
+            ):
+                seen[workload_no].add(signature)
+                workload_map[workload_no][1].append(mapping)
+                added += 1
+        if not added:
+            break
+
+    model, variables, mappings, _ = build_mapping_model(
+        substrate, workload_map, slack=True
+    )
     model.solve()
+    placed = set()
+    for var, mapping in zip(variables, mappings):
+        if (var.value() or 0) > 0:
+            placed.add(int(var.name.split("_")[1]))
+            update_load(substrate, mapping, 0, algo_end_time - 1)
 
-    for var in model.variables():
-        if var.value() > 0:
-            workload_no, mapping_idx = list(map(int, var.name.split("_")[1:]))
-            update_load(
-                graph, workload_map[workload_no][1][mapping_idx], 0, algo_end_time - 1
+    # The integer model only sees the generated columns, so retry the workloads it
+    # left out on the remaining capacity
+    networks = dict()
+    for workload_no, (flow, edge_demand, current_time) in enumerate(workloads):
+        if workload_no in placed or not workload_map[workload_no][1]:
+            continue
+        key = (edge_demand, current_time)
+        if key not in networks:
+            networks.update(
+                {key: get_flow_network(substrate, edge_demand, current_time)}
             )
+        _, min_graph, _, _ = min_congestion(
+            substrate,
+            flow,
+            edge_demand,
+            current_time,
+            workers,
+            networks.get(key),
+            engine,
+            prune,
+            pool=pool,
+        )
+        if min_graph:
+            update_load(substrate, min_graph, 0, algo_end_time - 1)
+        else:
+            print("Couldn't fit workload in substrate graph.")
 
 
-def fetch_congestion_value(graph):
+def fetch_congestion_value(substrate):
     congestion = 0
-    for _, _, values in graph.edges(data=True):
-        capacity = values.get("capacity")
-        for load in values.get("load"):
-            congestion = max(congestion, load / capacity)
-    for _, values in graph.nodes(data=True):
-        capacity = values.get("capacity")
-        for load in values.get("load"):
-            congestion = max(congestion, load / capacity)
+    if substrate.edge_count:
+        edge_congestion = substrate.edge_load.range_max() / substrate.edge_capacity
+        congestion = max(congestion, edge_congestion.max().item())
+    if substrate.node_count:
+        node_congestion = substrate.node_load.range_max() / substrate.node_capacity
+        congestion = max(congestion, node_congestion.max().item())
     return congestion
 
 
-def min_congestion_star_workload(
-    topology, leaf_counts, variant, save_graph, save_drive, workload_details
-):
-    congestions = list()
-    substrate_graphs = get_substrate_graphs(topology)
-    folder_path = (
-        f"figures/{datetime.now().strftime('%Y_%m_%d')}" if save_graph else None
-    )
+def get_workloads(leaf_counts=None, workload_details=None, workload_file=None):
+    """
+    Workloads of a run as (workloads, algo_end_time), calling workloads() gives a
+    fresh iterator of (start_time, end_time, leaf_count) in start time order.
+    None when there is nothing to map.
+    """
+    if workload_file:
+        algo_end_time, workload_count, is_sorted = scan_workload_trace(workload_file)
+        if not workload_count:
+            print("No workload found in trace. Exiting...")
+            return None
+
+        def workloads():
+            return sorted_workload_trace(workload_file, is_sorted)
+
+        return workloads, algo_end_time
+
     if not (leaf_counts or workload_details):
         print("No workload info found. Exiting...")
-        return
+        return None
     if not workload_details:
         workload_details = [(0, 1, lc) for lc in leaf_counts]
-    workload_details.sort()
+    workload_details = sorted(workload_details)
     algo_end_time = max([t for _, t, _ in workload_details]) + 1
-    for title, graph in substrate_graphs:
-        for u in graph.nodes():
-            graph.nodes().get(u).update({"load": [0] * algo_end_time})
-        for u, v in graph.edges():
-            graph.edges()[u, v].update({"load": [0] * algo_end_time})
-
-        if variant == "offline":
-            all_mappings = list()
-        else:
-            added_flows = list()
-            graph_path = (
-                f"{folder_path}/{title}_{datetime.now().strftime('%H_%M_%S')}"
-                if folder_path
-                else None
+
+    def workloads():
+        return iter(workload_details)
+
+    return workloads, algo_end_time
+
+
+def min_congestion_topology(
+    title,
+    graph,
+    workloads,
+    algo_end_time,
+    variant,
+    folder_path=None,
+    workers=1,
+    engine="networkx",
+    prune=False,
+    cache_size=0,
+    column_generation=False,
+    incremental_weights=False,
+    event_driven=False,
+    batch_admission=False,
+    shortest_path_index=False,
+    save_snapshots=False,
+    layout=None,
+    workload_type="star",
+    demand_range=None,
+    seed=None,
+    draw_graph=True,
+):
+    # Maps every workload on one substrate graph and returns its congestion.
+    # Without draw_graph only saved figures are drawn
+    event_driven = event_driven and variant != "offline"
+    general = workload_type != "star"
+    column_generation = column_generation and not general
+    # Workload graphs other than stars are drawn from the run's seed
+    workload_rng = get_rng(seed)
+    # Event driven substrates only hold the current slot, departures release it.
+    # Otherwise loads are kept for every slot of the horizon, so memory only stays
+    # bounded by the live workloads with event_driven
+    substrate = ArraySubstrate(graph, 1 if event_driven else algo_end_time)
+    cache = MappingCache(cache_size) if cache_size else None
+    # Worker processes are started once for all the workloads of the run
+    worker_count = get_worker_count(workers)
+    pool = MappingPool(worker_count) if worker_count > 1 else None
+    index = ShortestPathIndex(substrate) if shortest_path_index else None
+    paths = ServerPaths() if general else None
+    placements = defaultdict(list)
+    peak_congestion = 0
+
+    if variant == "offline":
+        all_mappings = list()
+        offline_workloads = list()
+        offline_substrate = substrate.copy()
+    else:
+        added_flows = list()
+        graph_path = (
+            f"{folder_path}/{title}_{datetime.now().strftime('%H_%M_%S')}"
+            if folder_path
+            else None
+        )
+        # Drawing removed since it requires a lot more tweaks. Layouts are only
+        # cached next to saved figures
+        drawing = (
+            DrawGraphs(
+                graph,
+                with_labels=True,
+                layout=layout,
+                path=graph_path,
+                cache_dir=LAYOUT_CACHE_DIR if graph_path else None,
             )
-            # Drawing removed since it requires a lot more tweaks
-            drawing = DrawGraphs(graph, with_labels=True, path=graph_path)
-
-        for current_time in range(algo_end_time):
-            min_graph = None
-            # workloads_to_remove = [
-            #     (s, t, l) for s, t, l in workload_details if t == current_time
-            # ]
-            # if workloads_to_remove:
-            #     drawing.remove_flow()
-            workloads_to_map = [
-                (s, t, l) for s, t, l in workload_details if s == current_time
-            ]
-            if not workloads_to_map:
-                continue
-            for i, (start_time, end_time, lc) in enumerate(workloads_to_map):
-                # Hard-coding workload graph, as star workload is trivial to visualize
-                # workload_graph = generate_workload(edge_demand=1, node_count=lc)
-                # flow = len(workload_graph.nodes()) - 1
-                # edge_demand = list(nx.get_edge_attributes(workload_graph, "weight").values())[0]
-                flow = lc
-                edge_demand = 1
-                if variant == "offline":
-                    all_mappings.append(
-                        (
-                            i,
-                            [
-                                flow_graph
-                                for _, flow_graph, _, _ in fetch_all_mappings(
-                                    graph.copy(), flow, edge_demand, current_time
-                                )
-                            ],
-                        )
+            if graph_path or draw_graph
+            else None
+        )
+        # One results file per run, substrate loads only when snapshots are asked for
+        results = (
+            ResultsWriter(graph_path, substrate if save_snapshots else None)
+            if graph_path
+            else None
+        )
+
+    # Only time slots with events are visited, empty ones are skipped
+    for current_time, events in groupby(
+        workload_events(workloads()), key=lambda event: event[0]
+    ):
+        min_graph = None
+        slot = 0 if event_driven else current_time
+        workloads_to_map = list()
+        for _, kind, workload in events:
+            if kind == ARRIVAL:
+                workloads_to_map.append(workload)
+            elif event_driven and workload in placements:
+                # Otherwise loads only span [start_time, end_time] already
+                records = placements[workload]
+                release_load(substrate, records.pop(), slot)
+                if not records:
+                    del placements[workload]
+            # drawing.remove_flow()
+        if not workloads_to_map:
+            continue
+        if batch_admission:
+            # Largest arrivals first, they have the fewest feasible sources
+            workloads_to_map.sort(key=lambda workload: -workload[2])
+        # Residual network templates of this time step, keyed by edge demand
+        networks = dict()
+        # Source distances shared by the batch, keyed by edge demand
+        distances = dict()
+        for i, (start_time, end_time, lc) in enumerate(workloads_to_map):
+            # Hard-coding workload graph, as star workload is trivial to visualize
+            # workload_graph = generate_workload(edge_demand=1, node_count=lc)
+            # flow = len(workload_graph.nodes()) - 1
+            # edge_demand = list(nx.get_edge_attributes(workload_graph, "weight").values())[0]
+            flow = lc
+            edge_demand = 1
+            if general:
+                workload_graph = generate_workload(
+                    demand_range or edge_demand, lc, workload_rng, workload_type
+                )
+            elif edge_demand not in networks:
+                networks.update(
+                    {edge_demand: get_flow_network(substrate, edge_demand, slot)}
+                )
+            network = networks.get(edge_demand)
+            if variant == "offline" and general:
+                # Candidates are the mappings on top of the earlier workloads'
+                # mappings and on the empty substrate, which leaves the LP a
+                # combination that fits. Only the former are loaded, the empty
+                # substrate's would overload the earlier ones
+                candidates = list()
+                signatures = set()
+                for scratch in [offline_substrate, substrate]:
+                    mapping, _, _ = map_workload(
+                        scratch.view(), workload_graph, current_time, paths
+                    )
+                    if not mapping:
+                        continue
+                    if scratch is offline_substrate:
+                        update_load(scratch, mapping, 0, algo_end_time - 1)
+                    signature = mapping_signature(substrate, mapping)
+                    if signature not in signatures:
+                        signatures.add(signature)
+                        candidates.append(mapping)
+                all_mappings.append((i, candidates))
+            elif variant == "offline" and column_generation:
+                offline_workloads.append((flow, edge_demand, current_time))
+            elif variant == "offline":
+                all_mappings.append(
+                    (
+                        i,
+                        [
+                            flow_graph
+                            for flow_graph, _, _ in fetch_cached_mappings(
+                                substrate.view(),
+                                flow,
+                                edge_demand,
+                                current_time,
+                                workers,
+                                network,
+                                engine,
+                                cache=cache,
+                                index=index,
+                                pool=pool,
+                            )
+                        ],
+                    )
+                )
+            else:
+                load_window = (slot, slot) if event_driven else (start_time, end_time)
+                # The event driven substrate only holds the live loads, which can
+                # only fall until the next arrival. Weighting them over the whole
+                # duration bounds the weights over [start_time, end_time]
+                slot_count = end_time - start_time + 1 if event_driven else 1
+                if not batch_admission or i == 0 or variant == "default":
+                    # Online weights stay fixed while a batch is admitted, the
+                    # default variant only increases them so shared source
+                    # distances remain lower bounds
+                    update_weight(
+                        substrate,
+                        min_graph,
+                        *load_window,
+                        variant,
+                        incremental_weights,
+                        slot_count,
+                    )
+                if batch_admission and not general and edge_demand not in distances:
+                    get_flow_network(substrate, edge_demand, slot, network)
+                    distances.update({edge_demand: source_distances(network)})
+                if general:
+                    min_graph, cost, source = map_workload(
+                        substrate.view(), workload_graph, slot, paths
                     )
                 else:
-                    path = f"{graph_path}_{i}_{flow}" if graph_path else None
-                    update_weight(graph, min_graph, start_time, end_time, variant)
-                    min_substrate_graph, min_graph, cost, source = min_congestion(
-                        graph.copy(), flow, edge_demand, current_time
+                    _, min_graph, cost, source = min_congestion(
+                        substrate.view(),
+                        flow,
+                        edge_demand,
+                        slot,
+                        workers,
+                        network,
+                        engine,
+                        prune or batch_admission,
+                        cache,
+                        distances.get(edge_demand),
+                        index,
+                        snapshot=False,
+                        pool=pool,
                     )
-                    save_flow_details(min_substrate_graph, min_graph, flow, cost, path)
-                    if min_graph:
-                        added_flows.append(flow)
-                        drawing.add_flow(min_graph, source)
-                        update_load(graph, min_graph, start_time, end_time)
-                    else:
-                        print("Couldn't fit workload in substrate graph.")
-        if variant == "offline":
-            solve_lp(graph, all_mappings, algo_end_time)
-        else:
-            pass
-            drawing.add_title(title=f"Flow: {added_flows}")
-            drawing.draw()
-        congestions.append(fetch_congestion_value(graph))
-    print(congestions)
+                if results:
+                    with profiler.phase("output"):
+                        workload_id = results.record(
+                            (start_time, end_time, lc),
+                            current_time,
+                            flow,
+                            source,
+                            cost,
+                            min_graph,
+                        )
+                if min_graph:
+                    added_flows.append(flow)
+                    if drawing:
+                        with profiler.phase("drawing"):
+                            drawing.add_flow(min_graph, source)
+                    record = update_load(substrate, min_graph, *load_window)
+                    if results and save_snapshots:
+                        with profiler.phase("output"):
+                            results.snapshot(workload_id, slot)
+                    if event_driven:
+                        placements[(start_time, end_time, lc)].append(record)
+                        peak_congestion = max(
+                            peak_congestion,
+                            placement_congestion(substrate, record, slot),
+                        )
+                else:
+                    print("Couldn't fit workload in substrate graph.")
+    if variant == "offline" and column_generation:
+        solve_column_generation(
+            substrate, offline_workloads, algo_end_time, workers, engine, prune, pool
+        )
+    elif variant == "offline":
+        solve_lp(substrate, all_mappings, algo_end_time)
+    else:
+        pass
+        if drawing:
+            with profiler.phase("drawing"):
+                drawing.add_title(title=f"Flow: {added_flows}")
+                drawing.draw()
+        if results:
+            with profiler.phase("output"):
+                results.close()
+    if pool:
+        pool.close()
+    if cache:
+        print(f"Mapping cache {title}: {cache.stats()}")
+    return peak_congestion if event_driven else fetch_congestion_value(substrate)
+
+
+# Keys identifying a run of a sweep in the results file
+SWEEP_KEYS = ["topology", "title", "seed", "variant", "config"]
+
+
+def sweep_key(record):
+    return tuple(record.get(key) for key in SWEEP_KEYS)
+
+
+# Options that change the results of a run. Workers, pruning, caching, incremental
+# weights and what gets saved or drawn leave them as they are
+SWEEP_CONFIG_OPTIONS = [
+    "engine",
+    "column_generation",
+    "event_driven",
+    "batch_admission",
+    "shortest_path_index",
+    "workload_type",
+    "demand_range",
+]
+
+
+def sweep_config(workloads, options):
+    """
+    Digest of the workloads and the result changing options of a sweep, part of
+    its runs' keys so a sweep rerun with other ones doesn't skip runs of the
+    earlier sweep. A workload file counts by its content.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    settings = json.dumps(
+        [workloads, {key: options.get(key) for key in SWEEP_CONFIG_OPTIONS}],
+        sort_keys=True,
+        default=str,
+    )
+    digest.update(settings.encode())
+    _, _, workload_file = workloads
+    if workload_file:
+        digest.update(file_digest(workload_file).encode())
+    return digest.hexdigest()
+
+
+def read_sweep_results(path):
+    # Completed runs of an earlier (possibly interrupted) sweep
+    completed = dict()
+    if not isfile(path):
+        return completed
+    with open(path, "r") as results_file:
+        for line in results_file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Line cut short by a crash, the run is repeated
+                continue
+            completed.update({sweep_key(record): record})
+    return completed
+
+
+def run_sweep_job(job):
+    workloads, algo_end_time = get_workloads(*job["workloads"])
+    graph = get_substrate_graph(job["topology"], job["title"], job["seed"])
+    start = time.perf_counter()
+    congestion = min_congestion_topology(
+        job["title"],
+        graph,
+        workloads,
+        algo_end_time,
+        job["variant"],
+        job["folder_path"],
+        seed=job["seed"],
+        # Workers of a sweep never show figures, they only save them with -sg
+        draw_graph=False,
+        **job["options"],
+    )
+    # Figures of the run are saved before it counts as completed
+    finish_rendering()
+    record = {key: job[key] for key in SWEEP_KEYS}
+    record.update({"congestion": congestion, "seconds": time.perf_counter() - start})
+    return record
+
+
+def run_sweep(
+    topology,
+    variants,
+    seeds,
+    workloads,
+    results_path,
+    folder_path=None,
+    sweep_workers=0,
+    options=None,
+):
+    """
+    Runs every (topology graph, seed, variant) in its own worker process. Results
+    are appended to a JSON lines file as runs finish, runs already in the file for
+    the same workloads and options are skipped so an interrupted sweep resumes
+    where it stopped.
+    """
+    completed = read_sweep_results(results_path)
+    options = options or dict()
+    config = sweep_config(workloads, options)
+    jobs = [
+        {
+            "topology": topology,
+            "title": title,
+            "seed": seed,
+            "variant": variant,
+            "workloads": workloads,
+            # Runs of a sweep finish within the same second, keep their files apart
+            "folder_path": f"{folder_path}/{variant}_seed_{seed}"
+            if folder_path
+            else None,
+            "options": options,
+            "config": config,
+        }
+        for title in get_substrate_titles(topology)
+        for seed in seeds
+        for variant in variants
+    ]
+    job_count = len(jobs)
+    jobs = [job for job in jobs if sweep_key(job) not in completed]
+    print(f"Sweep: {job_count - len(jobs)} runs done, {len(jobs)} to run.")
+    if not jobs:
+        return completed
+
+    directory = dirname(results_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(results_path, "a+") as results_file:
+        # Start on a fresh line after a record cut short by a crash
+        if results_file.tell():
+            results_file.seek(results_file.tell() - 1)
+            if results_file.read(1) != "\n":
+                results_file.write("\n")
+        with ProcessPoolExecutor(
+            max_workers=get_worker_count(sweep_workers)
+        ) as executor:
+            futures = {executor.submit(run_sweep_job, job): job for job in jobs}
+            for future in as_completed(futures):
+                job = futures.get(future)
+                try:
+                    record = future.result()
+                except Exception as error:
+                    print(f"Sweep run {sweep_key(job)} failed: {error}")
+                    continue
+                results_file.write(json.dumps(record) + "\n")
+                results_file.flush()
+                completed.update({sweep_key(record): record})
+                print(f"Sweep run {sweep_key(record)}: {record['congestion']}")
+    return completed
+
+
+def min_congestion_star_workload(
+    topology,
+    leaf_counts,
+    variant,
+    save_graph,
+    save_drive,
+    workload_details,
+    workers=1,
+    engine="networkx",
+    prune=False,
+    cache_size=0,
+    column_generation=False,
+    incremental_weights=False,
+    workload_file=None,
+    event_driven=False,
+    batch_admission=False,
+    shortest_path_index=False,
+    save_snapshots=False,
+    layout=None,
+    storage_dir=None,
+    workload_type="star",
+    demand_range=None,
+    seed=None,
+    sweep_file=None,
+    sweep_seeds=None,
+    sweep_variants=None,
+    sweep_workers=0,
+):
+    congestions = list()
+    folder_path = (
+        f"figures/{datetime.now().strftime('%Y_%m_%d')}" if save_graph else None
+    )
+    workload_source = get_workloads(leaf_counts, workload_details, workload_file)
+    if not workload_source:
+        return
+    workloads, algo_end_time = workload_source
+    variants = (sweep_variants or [variant]) if sweep_file else [variant]
+    if event_driven and "offline" in variants:
+        print("Event driven mode only applies to online variants, ignoring it.")
+    if column_generation and workload_type != "star":
+        print("Column generation only applies to star workloads, solving the LP.")
+    options = {
+        "workers": workers,
+        "engine": engine,
+        "prune": prune,
+        "cache_size": cache_size,
+        "column_generation": column_generation,
+        "incremental_weights": incremental_weights,
+        "event_driven": event_driven,
+        "batch_admission": batch_admission,
+        "shortest_path_index": shortest_path_index,
+        "save_snapshots": save_snapshots,
+        "layout": layout,
+        "workload_type": workload_type,
+        "demand_range": demand_range,
+    }
+    if sweep_file:
+        run_sweep(
+            topology,
+            variants,
+            sweep_seeds or [seed],
+            (leaf_counts, workload_details, workload_file),
+            sweep_file,
+            folder_path,
+            sweep_workers,
+            options,
+        )
+    else:
+        for title, graph in get_substrate_graphs(topology, seed):
+            congestions.append(
+                min_congestion_topology(
+                    title,
+                    graph,
+                    workloads,
+                    algo_end_time,
+                    variant,
+                    folder_path,
+                    seed=seed,
+                    **options,
+                )
+            )
+        print(congestions)
+    finish_rendering()
 
-    if save_drive:
-        folder_id = get_google_drive_folder_id(topology)
-        upload_to_google_drive(folder_path, folder_id)
-        shutil.rmtree(folder_path)
+    if save_drive and folder_path:
+        if storage_dir:
+            storage = LocalStorage(storage_dir)
+        else:
+            storage = GoogleDriveStorage(get_google_drive_folder_id(topology))
+        # Local results are only removed once every file is stored
+        if not upload_directory(storage, folder_path):
+            shutil.rmtree(folder_path)
 
 
 if __name__ == "__main__":
@@ -380,8 +1375,163 @@ if __name__ == "__main__":
         help="Details of incoming workload, (start_time, end_time, leaf_count)",
         type=lambda a: tuple(map(int, a.split(","))),
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        help="Worker processes for per-source min cost flow (0 uses all cores).",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        choices=ALLOWED_ENGINES,
+        help="Min cost flow engine used for every source, all engines return the same "
+        "flows.",
+        type=str.lower,
+        default="networkx",
+    )
+    parser.add_argument(
+        "-p",
+        "--prune",
+        help="Skip sources whose lower bound can't beat the best cost found so far.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-cs",
+        "--cache_size",
+        help="Mapping cache entries kept per topology (0 disables the cache).",
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "-cg",
+        "--column_generation",
+        help="Generate offline mappings from LP duals instead of enumerating them.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-iw",
+        "--incremental_weights",
+        help=(
+            "Only recompute online weights of resources whose load changed. Without"
+            " -ed this only applies between workloads with the same time window."
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "-wf",
+        "--workload_file",
+        help="CSV or JSONL trace of (start_time, end_time, leaf_count), read lazily.",
+        type=str,
+    )
+    parser.add_argument(
+        "-ed",
+        "--event_driven",
+        help="Keep only the current load and release it on workload departures. "
+        "Memory is only bounded by the live workloads in this mode, otherwise the "
+        "loads of every time slot of the horizon are kept.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-ba",
+        "--batch_admission",
+        help="Admit the arrivals of a time slot together on shared source distances.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-si",
+        "--shortest_path_index",
+        help="Route along cached shortest path trees when no edge capacity binds.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-sn",
+        "--save_snapshots",
+        help="With --save_graph, also save substrate loads after every placement.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-sdir",
+        "--storage_dir",
+        help="With --save_drive, store results in this local directory instead of Google Drive.",
+        type=str,
+    )
+    parser.add_argument(
+        "-wt",
+        "--workload_type",
+        choices=ALLOWED_WORKLOAD_TYPES,
+        help="Workload graph, stars are mapped exactly, the others heuristically.",
+        type=str.lower,
+        default="star",
+    )
+    parser.add_argument(
+        "-dr",
+        "--demand_range",
+        nargs=2,
+        help="Inclusive range of the random edge demands of workload graphs (1 when omitted).",
+        type=int,
+    )
+    parser.add_argument(
+        "-gl",
+        "--graph_layout",
+        choices=ALLOWED_LAYOUTS,
+        help="Layout of drawn graphs (spring, or spectral on large graphs, when omitted).",
+        type=str.lower,
+    )
+    parser.add_argument(
+        "-s",
+        "--seed",
+        help="Seed of the generated substrate topologies (random when omitted).",
+        type=int,
+    )
+    parser.add_argument(
+        "-pr",
+        "--profile",
+        help="Print time spent per phase and event counters after the run.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-pf",
+        "--profile_file",
+        help="Profile dump, a JSON summary for .json paths, cProfile stats otherwise.",
+        type=str,
+    )
+    parser.add_argument(
+        "-sf",
+        "--sweep_file",
+        help="Run every topology graph in parallel, appending results to this JSON lines file (completed runs are skipped).",
+        type=str,
+    )
+    parser.add_argument(
+        "-ss",
+        "--sweep_seeds",
+        nargs="+",
+        help="Substrate seeds run by the sweep (defaults to --seed).",
+        type=int,
+    )
+    parser.add_argument(
+        "-sv",
+        "--sweep_variants",
+        nargs="+",
+        choices=ALLOWED_VARIANTS,
+        help="Variants run by the sweep (defaults to --variant).",
+        type=str.lower,
+    )
+    parser.add_argument(
+        "-sw",
+        "--sweep_workers",
+        help="Worker processes of the sweep (0 uses all cores).",
+        type=int,
+        default=0,
+    )
     args = parser.parse_args()
     config = vars(args)
+    profile_file = config.get("profile_file")
+    if config.get("profile") or profile_file:
+        profiler.start(
+            cprofile=bool(profile_file) and not profile_file.endswith(".json")
+        )
     min_congestion_star_workload(
         topology=config.get("topology", None),
         leaf_counts=config.get("leaf_counts"),
@@ -389,4 +1539,30 @@ if __name__ == "__main__":
         save_drive=config.get("save_drive"),
         variant=config.get("variant"),
         workload_details=config.get("workload_details"),
+        workers=config.get("workers"),
+        engine=config.get("engine"),
+        prune=config.get("prune"),
+        cache_size=config.get("cache_size"),
+        column_generation=config.get("column_generation"),
+        incremental_weights=config.get("incremental_weights"),
+        workload_file=config.get("workload_file"),
+        event_driven=config.get("event_driven"),
+        batch_admission=config.get("batch_admission"),
+        shortest_path_index=config.get("shortest_path_index"),
+        save_snapshots=config.get("save_snapshots"),
+        layout=config.get("graph_layout"),
+        storage_dir=config.get("storage_dir"),
+        workload_type=config.get("workload_type"),
+        demand_range=config.get("demand_range"),
+        seed=config.get("seed"),
+        sweep_file=config.get("sweep_file"),
+        sweep_seeds=config.get("sweep_seeds"),
+        sweep_variants=config.get("sweep_variants"),
+        sweep_workers=config.get("sweep_workers"),
     )
+    if profiler.enabled:
+        profiler.stop()
+        if config.get("profile"):
+            profiler.print_summary()
+        if profile_file:
+            profiler.dump(profile_file)
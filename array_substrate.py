@@ -0,0 +1,244 @@
+import numpy as np
+
+from scipy.sparse import csr_matrix
+
+
+def read_only(array):
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+def edge_graph(indptr, indices, adj_edges, weights, edges=None):
+    """
+    Symmetric (nodes x nodes) sparse matrix over a CSR adjacency, weighted per
+    edge. Only the edges of the boolean mask edges are kept when given. Zero
+    weights stay explicit entries, which scipy.sparse.csgraph treats as edges.
+    """
+    node_count = len(indptr) - 1
+    data = np.asarray(weights, dtype=float)[adj_edges]
+    if edges is None:
+        return csr_matrix(
+            (data, indices.copy(), indptr.copy()), shape=(node_count, node_count)
+        )
+    keep = np.asarray(edges)[adj_edges]
+    rows = np.repeat(np.arange(node_count), np.diff(indptr))
+    return csr_matrix(
+        (data[keep], (rows[keep], indices[keep])), shape=(node_count, node_count)
+    )
+
+
+class TimeSeriesLoad:
+    """
+    Load of a set of resources over the time horizon. Range additions are O(1) per
+    resource on a difference array, they are folded into the load matrix on the
+    next query, only for the resources that changed and from the earliest slot
+    added to on.
+    """
+
+    def __init__(self, rows, time_slots, dtype=float):
+        self.values = np.zeros((rows, time_slots), dtype=dtype)
+        self.pending = np.zeros((rows, time_slots + 1), dtype=dtype)
+        self.dirty = np.zeros(rows, dtype=bool)
+        # Earliest slot with pending additions, None when nothing is pending
+        self.first = None
+        # Rows added to since the last pop_changed(), independent of flushing
+        self.changed = np.zeros(rows, dtype=bool)
+
+    @property
+    def time_slots(self):
+        return self.values.shape[1]
+
+    def copy(self):
+        series = object.__new__(TimeSeriesLoad)
+        series.values = self.values.copy()
+        series.pending = self.pending.copy()
+        series.dirty = self.dirty.copy()
+        series.first = self.first
+        series.changed = self.changed.copy()
+        return series
+
+    def view(self):
+        # Read-only series sharing the folded loads, later additions to this series
+        # show up in the view once they are flushed here
+        series = object.__new__(TimeSeriesLoad)
+        series.values = read_only(self.flush())
+        series.pending = read_only(self.pending)
+        series.dirty = np.broadcast_to(False, self.dirty.shape)
+        series.first = None
+        series.changed = np.broadcast_to(False, self.changed.shape)
+        return series
+
+    def add(self, rows, start_time, end_time, amounts):
+        # Add amounts to every slot of [start_time, end_time] of the given rows
+        rows = np.asarray(rows, dtype=np.int64)
+        amounts = np.broadcast_to(
+            np.asarray(amounts, dtype=self.pending.dtype), rows.shape
+        )
+        np.add.at(self.pending[:, start_time], rows, amounts)
+        np.add.at(self.pending[:, end_time + 1], rows, -amounts)
+        self.dirty[rows] = True
+        self.changed[rows] = True
+        self.first = start_time if self.first is None else min(self.first, start_time)
+
+    def pop_changed(self):
+        rows = np.flatnonzero(self.changed)
+        self.changed[rows] = False
+        return rows
+
+    def flush(self):
+        if self.first is None:
+            return self.values
+        rows = np.flatnonzero(self.dirty)
+        first = self.first
+        self.values[rows, first:] += np.cumsum(self.pending[rows, first:-1], axis=1)
+        self.pending[rows, first:] = 0
+        self.dirty[rows] = False
+        self.first = None
+        return self.values
+
+    def at(self, time):
+        return self.flush()[:, time]
+
+    def window(self, start_time, end_time, rows=slice(None)):
+        return self.flush()[rows, start_time : end_time + 1]
+
+    def range_max(self, start_time=0, end_time=None, rows=slice(None)):
+        if end_time is None:
+            end_time = self.time_slots - 1
+        return self.window(start_time, end_time, rows).max(axis=1)
+
+    def range_sum(self, start_time=0, end_time=None, rows=slice(None)):
+        if end_time is None:
+            end_time = self.time_slots - 1
+        return self.window(start_time, end_time, rows).sum(axis=1)
+
+
+class ArraySubstrate:
+    """
+    Compact substrate representation used by the min congestion loop. Nodes and
+    edges are addressed by integer index, adjacency is stored in CSR form over
+    both directions of every edge and loads are kept in (resources x time) matrices.
+    """
+
+    def __init__(self, graph, time_slots):
+        self.time_slots = time_slots
+        # Time window the current online weights were computed for and the slot
+        # count they were scaled by
+        self.weight_window = None
+        self.weight_slot_count = None
+
+        # Nodes
+        self.nodes = list(graph.nodes())
+        self.node_index = {u: i for i, u in enumerate(self.nodes)}
+        node_data = [values for _, values in graph.nodes(data=True)]
+        self.node_capacity = np.array(
+            [values.get("capacity", 0) for values in node_data]
+        )
+        self.node_weight = np.array(
+            [values.get("weight", 0) for values in node_data], dtype=float
+        )
+        self.is_switch = np.array(
+            [bool(values.get("is_switch", False)) for values in node_data], dtype=bool
+        )
+
+        # Edges
+        edge_data = list(graph.edges(data=True))
+        self.edges = [(u, v) for u, v, _ in edge_data]
+        self.edge_index = dict()
+        for e, (u, v) in enumerate(self.edges):
+            self.edge_index.update({(u, v): e, (v, u): e})
+        self.edge_u = np.array(
+            [self.node_index[u] for u, _ in self.edges], dtype=np.int64
+        )
+        self.edge_v = np.array(
+            [self.node_index[v] for _, v in self.edges], dtype=np.int64
+        )
+        self.edge_capacity = np.array(
+            [values.get("capacity", 0) for _, _, values in edge_data]
+        )
+        self.edge_weight = np.array(
+            [values.get("weight", 0) for _, _, values in edge_data], dtype=float
+        )
+
+        # CSR adjacency, every undirected edge appears once per direction
+        tails = np.concatenate((self.edge_u, self.edge_v))
+        heads = np.concatenate((self.edge_v, self.edge_u))
+        arc_edges = np.concatenate((np.arange(len(self.edges)),) * 2)
+        order = np.argsort(tails, kind="stable")
+        self.indptr = np.zeros(len(self.nodes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(tails, minlength=len(self.nodes)), out=self.indptr[1:])
+        self.indices = heads[order]
+        self.adj_edges = arc_edges[order]
+
+        # Loads, integral as long as the capacities are
+        load_type = np.result_type(self.node_capacity, self.edge_capacity)
+        self.node_load = TimeSeriesLoad(len(self.nodes), time_slots, load_type)
+        self.edge_load = TimeSeriesLoad(len(self.edges), time_slots, load_type)
+        # Unscaled online load factors over weight_window, see update_weight
+        self.node_load_factor = np.zeros(len(self.nodes))
+        self.edge_load_factor = np.zeros(len(self.edges))
+
+    @property
+    def node_count(self):
+        return len(self.nodes)
+
+    @property
+    def edge_count(self):
+        return len(self.edges)
+
+    def copy(self):
+        substrate = object.__new__(ArraySubstrate)
+        substrate.__dict__.update(self.__dict__)
+        for key in [
+            "node_capacity",
+            "node_weight",
+            "edge_capacity",
+            "edge_weight",
+            "node_load",
+            "edge_load",
+            "node_load_factor",
+            "edge_load_factor",
+        ]:
+            setattr(substrate, key, getattr(self, key).copy())
+        return substrate
+
+    def view(self):
+        """
+        Read-only view sharing every array with this substrate, for code that only
+        reads it (the flow networks and mapping search). Writes through the view
+        raise instead of silently diverging from a copy.
+        """
+        substrate = object.__new__(ArraySubstrate)
+        substrate.__dict__.update(self.__dict__)
+        for key in [
+            "node_capacity",
+            "node_weight",
+            "is_switch",
+            "edge_u",
+            "edge_v",
+            "edge_capacity",
+            "edge_weight",
+            "indptr",
+            "indices",
+            "adj_edges",
+        ]:
+            setattr(substrate, key, read_only(getattr(self, key)))
+        substrate.node_load = self.node_load.view()
+        substrate.edge_load = self.edge_load.view()
+        return substrate
+
+    def edge_id(self, u, v):
+        return self.edge_index[u, v]
+
+    def arc_id(self, u, v):
+        # Flow network arc from u to v, 2e along edge e and 2e + 1 against it
+        e = self.edge_index[u, v]
+        return 2 * e + int(self.edge_u[e] != self.node_index[u])
+
+    def servers(self):
+        return [self.nodes[i] for i in np.flatnonzero(~self.is_switch)]
+
+    def weighted_graph(self, weights, edges=None):
+        # Shortest path input of the substrate, see edge_graph
+        return edge_graph(self.indptr, self.indices, self.adj_edges, weights, edges)
@@ -0,0 +1,315 @@
+import argparse
+import json
+import numpy as np
+import os
+import time
+import tracemalloc
+
+from datetime import datetime
+from math import inf
+
+from algorithm import (
+    fetch_all_mappings,
+    min_congestion,
+    solve_lp,
+    update_load,
+    update_weight,
+)
+from array_substrate import ArraySubstrate
+from constants import (
+    ALLOWED_ENGINES,
+    BENCHMARK_SEEDS,
+    BENCHMARK_SIZES,
+    BENCHMARK_TOLERANCE,
+    BENCHMARK_WORKLOADS,
+    DEFAULT_LEVEL,
+)
+from profiler import profiler
+from substrate import (
+    generate_bcube_topology_graph,
+    generate_clos_topology_graph,
+    generate_random_graph,
+    generate_xpander_topology_graph,
+)
+
+BENCHMARK_TOPOLOGIES = ["random", "clos", "bcube", "xpander"]
+BENCHMARK_CASES = ["min_congestion", "fetch_all_mappings", "solve_lp"]
+
+
+def generate_benchmark_graph(topology, size, seed):
+    # Size is roughly the number of servers of the topology
+    if topology == "random":
+        return generate_random_graph(node_count=size, seed=seed)
+    if topology == "clos":
+        return generate_clos_topology_graph(node_count=size, seed=seed)
+    if topology == "bcube":
+        # BCube(n, k) has n^(k + 1) servers
+        node_count = max(2, round(size ** (1 / (DEFAULT_LEVEL + 1))))
+        return generate_bcube_topology_graph(node_count=node_count, seed=seed)
+    if topology == "xpander":
+        return generate_xpander_topology_graph(node_count=size, seed=seed)
+    raise ValueError(f"Unknown benchmark topology {topology}.")
+
+
+def benchmark_workloads(seed):
+    # (start_time, end_time, leaf_count), all sharing the first time slot
+    rng = np.random.default_rng(seed)
+    return [(0, 1, lc) for lc in rng.integers(1, 6, BENCHMARK_WORKLOADS).tolist()]
+
+
+def run_min_congestion(substrate, workloads, engine):
+    for start_time, end_time, flow in workloads:
+        update_weight(substrate, None, start_time, end_time, "online")
+        _, min_graph, _, _ = min_congestion(
+            substrate, flow, 1, start_time, engine=engine
+        )
+        update_load(substrate, min_graph, start_time, end_time)
+
+
+def run_fetch_all_mappings(substrate, workloads, engine):
+    for start_time, _, flow in workloads:
+        fetch_all_mappings(substrate, flow, 1, start_time, engine=engine)
+
+
+def prepare_solve_lp(substrate, workloads, engine):
+    # Mappings are enumerated up front, only the LP itself is measured
+    return [
+        (
+            i,
+            [
+                flow_graph
+                for flow_graph, _, _ in fetch_all_mappings(
+                    substrate, flow, 1, start_time, engine=engine
+                )
+            ],
+        )
+        for i, (start_time, _, flow) in enumerate(workloads)
+    ]
+
+
+def run_solve_lp(substrate, workload_map, time_slots):
+    solve_lp(substrate, workload_map, time_slots)
+
+
+def run_case(case, graph, workloads, engine):
+    time_slots = max(end_time for _, end_time, _ in workloads) + 1
+    substrate = ArraySubstrate(graph, time_slots)
+    if case == "min_congestion":
+        return lambda: run_min_congestion(substrate.copy(), workloads, engine)
+    if case == "fetch_all_mappings":
+        return lambda: run_fetch_all_mappings(substrate, workloads, engine)
+    if case == "solve_lp":
+        workload_map = prepare_solve_lp(substrate, workloads, engine)
+        return lambda: run_solve_lp(substrate.copy(), workload_map, time_slots)
+    raise ValueError(f"Unknown benchmark case {case}.")
+
+
+def measure(run, repeat):
+    # Timing runs and the memory run are separate, tracemalloc slows allocations.
+    # The profiler counts the solves of the memory run, min cost flows and LPs
+    wall_time = inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        wall_time = min(wall_time, time.perf_counter() - start)
+    profiler.reset()
+    profiler.start()
+    tracemalloc.start()
+    try:
+        run()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        profiler.stop()
+    solves = profiler.counters["solves"] + profiler.calls["lp"]
+    return {
+        "wall_time": wall_time,
+        "peak_memory": peak_memory,
+        "solves": solves,
+        "solves_per_sec": solves / wall_time if wall_time > 0 else inf,
+    }
+
+
+def run_benchmarks(topologies, sizes, seeds, cases, engine="networkx", repeat=1):
+    results = list()
+    for topology in topologies:
+        for size in sizes:
+            for seed in seeds:
+                graph = generate_benchmark_graph(topology, size, seed)
+                workloads = benchmark_workloads(seed)
+                for case in cases:
+                    result = {
+                        "case": case,
+                        "topology": topology,
+                        "size": size,
+                        "seed": seed,
+                        "nodes": graph.number_of_nodes(),
+                        "edges": graph.number_of_edges(),
+                    }
+                    result.update(
+                        measure(run_case(case, graph, workloads, engine), repeat)
+                    )
+                    print(
+                        f"{case} {topology} size={size} seed={seed}: "
+                        f"{result['wall_time']:.4f}s, "
+                        f"{result['peak_memory'] / 1024:.0f} KiB, "
+                        f"{result['solves_per_sec']:.1f} solves/s"
+                    )
+                    results.append(result)
+    return results
+
+
+def result_key(result):
+    return (result["case"], result["topology"], result["size"], result["seed"])
+
+
+def compare_results(results, baseline, tolerance=BENCHMARK_TOLERANCE):
+    """
+    Regressions of results against a baseline run, matched on (case, topology,
+    size, seed). Wall time and peak memory regress when they grow by more than
+    the tolerance.
+    """
+    baseline = {result_key(result): result for result in baseline}
+    regressions = list()
+    for result in results:
+        previous = baseline.get(result_key(result))
+        if not previous:
+            continue
+        for metric in ["wall_time", "peak_memory"]:
+            if result[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(
+                    {
+                        "case": result["case"],
+                        "topology": result["topology"],
+                        "size": result["size"],
+                        "seed": result["seed"],
+                        "metric": metric,
+                        "baseline": previous[metric],
+                        "value": result[metric],
+                        "ratio": result[metric] / previous[metric]
+                        if previous[metric]
+                        else inf,
+                    }
+                )
+    return regressions
+
+
+def save_results(results, path, engine, regressions=None):
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(path, "w") as results_file:
+        json.dump(
+            {
+                "created": datetime.now().isoformat(),
+                "engine": engine,
+                "results": results,
+                "regressions": regressions or list(),
+            },
+            results_file,
+            indent=2,
+        )
+
+
+def load_results(path):
+    with open(path, "r") as results_file:
+        return json.load(results_file).get("results", list())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Minimum Congestion benchmarks",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "-t",
+        "--topologies",
+        nargs="+",
+        choices=BENCHMARK_TOPOLOGIES,
+        help="Generated topologies to benchmark.",
+        type=str.lower,
+        default=BENCHMARK_TOPOLOGIES,
+    )
+    parser.add_argument(
+        "-s",
+        "--sizes",
+        nargs="+",
+        help="Approximate server counts of the generated topologies.",
+        type=int,
+        default=BENCHMARK_SIZES,
+    )
+    parser.add_argument(
+        "-sd",
+        "--seeds",
+        nargs="+",
+        help="Generator seeds.",
+        type=int,
+        default=BENCHMARK_SEEDS,
+    )
+    parser.add_argument(
+        "-c",
+        "--cases",
+        nargs="+",
+        choices=BENCHMARK_CASES,
+        help="Functions to benchmark.",
+        default=BENCHMARK_CASES,
+    )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        choices=ALLOWED_ENGINES,
+        help="Min cost flow engine used for every source.",
+        type=str.lower,
+        default="networkx",
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        help="Timed runs per case, the fastest is kept.",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="Results file (JSON).",
+        type=str,
+        default=f"benchmarks/{datetime.now().strftime('%Y_%m_%d_%H_%M_%S')}.json",
+    )
+    parser.add_argument(
+        "-b", "--baseline", help="Results file to compare against.", type=str
+    )
+    parser.add_argument(
+        "-tol",
+        "--tolerance",
+        help="Relative growth over the baseline reported as a regression.",
+        type=float,
+        default=BENCHMARK_TOLERANCE,
+    )
+    args = parser.parse_args()
+    config = vars(args)
+    results = run_benchmarks(
+        topologies=config.get("topologies"),
+        sizes=config.get("sizes"),
+        seeds=config.get("seeds"),
+        cases=config.get("cases"),
+        engine=config.get("engine"),
+        repeat=config.get("repeat"),
+    )
+    regressions = None
+    if config.get("baseline"):
+        regressions = compare_results(
+            results, load_results(config.get("baseline")), config.get("tolerance")
+        )
+        for regression in regressions:
+            print(
+                f"Regression in {regression['case']} {regression['topology']} "
+                f"size={regression['size']} seed={regression['seed']}: "
+                f"{regression['metric']} {regression['baseline']:.4g} -> "
+                f"{regression['value']:.4g} ({regression['ratio']:.2f}x)"
+            )
+        if not regressions:
+            print("No regressions against the baseline.")
+    save_results(results, config.get("output"), config.get("engine"), regressions)
+    if regressions:
+        raise SystemExit(1)
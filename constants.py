@@ -1,8 +1,39 @@
 ALLOWED_TOPOLOGIES = ["internet", "clos", "bcube", "xpander", "random"]
 ALLOWED_VARIANTS = ["default", "online", "offline"]
+ALLOWED_ENGINES = ["networkx", "ssp"]
+ALLOWED_WORKLOAD_TYPES = ["star", "tree", "ring", "all_to_all"]
+ALLOWED_LAYOUTS = ["spring", "spectral", "circular", "tree"]
 MWU_FACTOR = 0.5
 GAMMA = 0.5
 RHO2 = 1
+# Sources handled per multi-source Dijkstra when computing lower bounds
+BOUND_CHUNK_SIZE = 256
+# Slack on lower bounds so that floating point noise never prunes the optimum
+BOUND_TOLERANCE = 1e-9
+# Column generation: pricing rounds, minimum reduced cost of a new column and
+# weight of the largest original cost when pricing on duals. Tie breaks of a
+# mapping with up to 1000 units of load stay below CG_TOLERANCE
+CG_MAX_ITERATIONS = 50
+CG_TOLERANCE = 1e-6
+CG_TIE_BREAK = 1e-9
+# Pricing weights are scaled by this and rounded, the tie break then stays integral
+CG_PRICE_SCALE = 10**12
+# Min cost flows are solved on integral weights, scaled by FLOW_WEIGHT_SCALE and
+# rounded, times FLOW_TIE_SCALE plus a tie break per arc of FLOW_HOP_COST and a
+# fixed random part below FLOW_TIE_RANGE. Equally weighted flows are decided by
+# their hops first, the optimum is unique and every engine finds the same flow
+FLOW_WEIGHT_SCALE = 2**20
+FLOW_TIE_SCALE = 2**64
+FLOW_HOP_COST = 2**40
+FLOW_TIE_RANGE = 2**16
+FLOW_TIE_SEED = 0
+# General workload mapping: cost added per hop so that paths stay short while
+# weights are 0, local search passes, minimum cost decrease of a move or swap and
+# moves tried to repair demands that can't be routed
+MAPPING_HOP_COST = 1e-3
+MAPPING_MAX_PASSES = 20
+MAPPING_TOLERANCE = 1e-9
+MAPPING_MAX_REPAIRS = 50
 
 DEFAULT_NODE_COUNT = 10
 DEFAULT_PROBABILITY = 0.5
@@ -13,3 +44,34 @@ DEFAULT_STAGE_COUNT = 1
 DEFAULT_EDGE_SWITCH_COUNT = 5
 DEFAULT_SERVERS_PER_RACK = 4
 DEFAULT_LIFT_NO = 2
+# Inclusive ranges of the random capacities and weights of generated substrates
+DEFAULT_CAPACITY_RANGE = (10, 50)
+DEFAULT_WEIGHT_RANGE = (1, 10)
+# Inclusive range of the random leaf count of a generated workload
+DEFAULT_LEAF_RANGE = (1, 10)
+# Internet topologies (graphml) and the cache of their processed graphs, bump the
+# version when their processing changes
+INTERNET_DIR = "dataset/internet"
+INTERNET_CACHE_DIR = f"{INTERNET_DIR}/.cache"
+INTERNET_CACHE_VERSION = 1
+# Drawing layouts: cache of computed positions, only kept when figures are saved
+# (bump the version when layouts change), and the node count above which spectral
+# replaces the spring layout
+LAYOUT_CACHE_DIR = "figures/.layouts"
+LAYOUT_CACHE_VERSION = 1
+LAYOUT_SPRING_LIMIT = 500
+# Placements buffered by the results writer before a chunk is appended
+RESULTS_CHUNK_SIZE = 1024
+# Suffix of the index of a results file and its costs, merged when uploading
+RESULTS_MANIFEST = "manifest.json"
+# Uploads of saved results: concurrent uploads, retries of a failed upload and the
+# delay before the first retry (seconds, doubled after every attempt)
+UPLOAD_WORKERS = 4
+UPLOAD_RETRIES = 3
+UPLOAD_BACKOFF = 1.0
+# Benchmarks: generator sizes, seeds, star workloads per case and the relative
+# slowdown (or memory growth) over the baseline reported as a regression
+BENCHMARK_SIZES = [10, 20]
+BENCHMARK_SEEDS = [0, 1, 2]
+BENCHMARK_WORKLOADS = 4
+BENCHMARK_TOLERANCE = 0.2
@@ -0,0 +1,137 @@
+import networkx as nx
+
+from heapq import heappop, heappush
+from math import inf
+
+
+class MinCostFlowEngine:
+    """
+    Solves the min cost flow of a bound FlowNetwork. solve() returns a flow dict
+    shaped like the one of nx.min_cost_flow and raises nx.NetworkXUnfeasible when
+    the demand can't be routed. Engines minimize the integral solve weights of the
+    network, whose optimum is unique, so every engine returns the same flow.
+    """
+
+    name = None
+
+    def solve(self, network):
+        raise NotImplementedError
+
+
+class NetworkxEngine(MinCostFlowEngine):
+    name = "networkx"
+
+    def solve(self, network):
+        return nx.min_cost_flow(network.graph, weight="solve_weight")
+
+
+class SuccessiveShortestPathEngine(MinCostFlowEngine):
+    """
+    Successive shortest paths with Dijkstra on reduced costs. Works on the arc
+    arrays of the network, so rebinding the source costs nothing beyond reading
+    the capacities.
+    """
+
+    name = "ssp"
+
+    def __residual_graph(self, network):
+        # Arc a has its reverse at a + arc_count, adjacency holds both kinds
+        residual_graph = network.cache.get(self.name)
+        if residual_graph:
+            return residual_graph
+        tails = network.arc_tails.tolist()
+        heads = network.arc_heads.tolist()
+        arc_count = len(tails)
+        adjacency = [list() for _ in range(len(network.nodes) + 1)]
+        for a, (u, v) in enumerate(zip(tails, heads)):
+            adjacency[u].append((a, v))
+            adjacency[v].append((a + arc_count, u))
+        residual_graph = (tails, heads, adjacency)
+        network.cache.update({self.name: residual_graph})
+        return residual_graph
+
+    def solve(self, network):
+        if network.source is None:
+            raise nx.NetworkXError("Flow network has no source bound.")
+        weights = network.solve_weights
+        if weights and min(weights) < 0:
+            # Dijkstra potentials need non-negative costs to start from
+            return nx.min_cost_flow(network.graph, weight="solve_weight")
+        capacities = network.arc_capacities().tolist()
+        for a, capacity in enumerate(capacities):
+            if capacity < 0:
+                raise nx.NetworkXUnfeasible(f"arc {a} has negative capacity")
+
+        tails, heads, adjacency = self.__residual_graph(network)
+        arc_count = len(capacities)
+        residual = capacities + [0] * arc_count
+        costs = weights + [-w for w in weights]
+        node_count = len(adjacency)
+        source, sink = network.node_index[network.source], node_count - 1
+        potential = [0] * node_count
+        remaining = network.flow
+        while remaining > 0:
+            distance, parent = self.__shortest_paths(
+                adjacency, residual, costs, potential, source, sink
+            )
+            if distance[sink] == inf:
+                raise nx.NetworkXUnfeasible("no flow satisfies all node demands")
+            for u in range(node_count):
+                potential[u] += min(distance[u], distance[sink])
+            bottleneck = remaining
+            u = sink
+            while u != source:
+                a = parent[u]
+                bottleneck = min(bottleneck, residual[a])
+                u = tails[a] if a < arc_count else heads[a - arc_count]
+            u = sink
+            while u != source:
+                a = parent[u]
+                residual[a] -= bottleneck
+                residual[
+                    a + arc_count if a < arc_count else a - arc_count
+                ] += bottleneck
+                u = tails[a] if a < arc_count else heads[a - arc_count]
+            remaining -= bottleneck
+
+        labels = list(network.nodes) + ["sink"]
+        flow_dict = {label: dict() for label in labels}
+        for a, (u, v) in enumerate(zip(tails, heads)):
+            flow_dict[labels[u]].update({labels[v]: residual[a + arc_count]})
+        return flow_dict
+
+    def __shortest_paths(self, adjacency, residual, costs, potential, source, sink):
+        distance = [inf] * len(adjacency)
+        parent = [None] * len(adjacency)
+        done = [False] * len(adjacency)
+        distance[source] = 0
+        heap = [(0, source)]
+        while heap:
+            d, u = heappop(heap)
+            if done[u]:
+                continue
+            done[u] = True
+            if u == sink:
+                break
+            base = potential[u]
+            for a, v in adjacency[u]:
+                if residual[a] <= 0 or done[v]:
+                    continue
+                nd = d + costs[a] + base - potential[v]
+                if nd < distance[v]:
+                    distance[v] = nd
+                    parent[v] = a
+                    heappush(heap, (nd, v))
+        return distance, parent
+
+
+ENGINES = {
+    engine.name: engine for engine in [NetworkxEngine(), SuccessiveShortestPathEngine()]
+}
+
+
+def get_engine(name):
+    engine = ENGINES.get(name)
+    if not engine:
+        raise ValueError(f"Unknown min cost flow engine {name}.")
+    return engine
@@ -0,0 +1,217 @@
+import networkx as nx
+import numpy as np
+
+from constants import (
+    FLOW_HOP_COST,
+    FLOW_TIE_RANGE,
+    FLOW_TIE_SCALE,
+    FLOW_TIE_SEED,
+    FLOW_WEIGHT_SCALE,
+)
+
+
+def solve_weight(weight, tie):
+    # Exact Python int, the scaled weights outgrow int64
+    return int(np.rint(weight * FLOW_WEIGHT_SCALE)) * FLOW_TIE_SCALE + tie
+
+
+class FlowNetwork:
+    """
+    Residual network of a substrate for one time step and edge demand. The graph is
+    built once, every substrate edge becomes an arc in both directions and every
+    server gets an arc to the sink. Moving to another candidate source only touches
+    the source node's demand, its incoming arcs and its sink arc.
+
+    Engines minimize the "solve_weight" of the arcs (see solve_weight), which
+    breaks ties between equally weighted flows the same way for all of them. Costs
+    are read from the "weight" of the arcs.
+    """
+
+    def __init__(self, substrate, edge_demand, current_time):
+        self.edge_demand = edge_demand
+        self.current_time = current_time
+        self.source = None
+        self.flow = 0
+        self.in_arcs = dict()
+        self.edge_capacity = None
+        self.edge_weight = None
+        self.node_capacity = None
+        self.node_weight = None
+        # Engine specific structures derived from the fixed arc layout
+        self.cache = dict()
+
+        self.graph = nx.DiGraph()
+        for u, is_switch in zip(substrate.nodes, substrate.is_switch.tolist()):
+            if is_switch:
+                self.graph.add_node(u, is_switch=True)
+            else:
+                self.graph.add_node(u)
+        for u, v in substrate.edges:
+            self.graph.add_edge(u, v)
+            self.graph.add_edge(v, u)
+        self.graph.add_node("sink")
+        self.servers = np.flatnonzero(~substrate.is_switch)
+        for i in self.servers.tolist():
+            self.graph.add_edge(substrate.nodes[i], "sink")
+
+        # Attribute dicts of the arcs, indexed like the substrate arrays
+        self.edge_arcs = [
+            (self.graph[u][v], self.graph[v][u]) for u, v in substrate.edges
+        ]
+        self.sink_arcs = [
+            self.graph[substrate.nodes[i]]["sink"] for i in self.servers.tolist()
+        ]
+
+        # Same arcs in array form, edge e gives arcs 2e (u->v) and 2e+1 (v->u),
+        # followed by one arc per server into the sink (index len(nodes))
+        self.nodes = substrate.nodes
+        self.node_index = substrate.node_index
+        self.indptr = substrate.indptr
+        self.indices = substrate.indices
+        self.adj_edges = substrate.adj_edges
+        self.arc_tails = np.concatenate(
+            (
+                np.column_stack((substrate.edge_u, substrate.edge_v)).ravel(),
+                self.servers,
+            )
+        )
+        self.arc_heads = np.concatenate(
+            (
+                np.column_stack((substrate.edge_v, substrate.edge_u)).ravel(),
+                np.full(len(self.servers), len(self.nodes)),
+            )
+        )
+        self.ties = [
+            FLOW_HOP_COST + tie
+            for tie in np.random.default_rng(FLOW_TIE_SEED)
+            .integers(0, FLOW_TIE_RANGE, len(self.arc_tails))
+            .tolist()
+        ]
+        self.solve_weights = [0] * len(self.arc_tails)
+        self.refresh(substrate)
+
+    def refresh(self, substrate):
+        edge_capacity = np.floor(
+            (substrate.edge_capacity - substrate.edge_load.at(self.current_time))
+            / self.edge_demand
+        ).astype(np.int64)
+        node_capacity = (
+            substrate.node_capacity - substrate.node_load.at(self.current_time)
+        )[self.servers]
+        self.update(
+            edge_capacity,
+            substrate.edge_weight.copy(),
+            node_capacity,
+            substrate.node_weight[self.servers],
+        )
+
+    def arc_state(self):
+        # Everything refresh() changes, enough to update a copy of this network
+        return (
+            self.edge_capacity,
+            self.edge_weight,
+            self.node_capacity,
+            self.node_weight,
+        )
+
+    def update(self, edge_capacity, edge_weight, node_capacity, node_weight):
+        # Rewrite only the arcs whose residual capacity or weight changed
+        source, flow = self.source, self.flow
+        self.unbind()
+
+        changed = self.__changed(
+            (self.edge_capacity, edge_capacity), (self.edge_weight, edge_weight)
+        )
+        for e in changed.tolist():
+            capacity, weight = edge_capacity[e].item(), edge_weight[e].item()
+            for a, arc in zip((2 * e, 2 * e + 1), self.edge_arcs[e]):
+                self.solve_weights[a] = solve_weight(weight, self.ties[a])
+                arc.update(
+                    {
+                        "capacity": capacity,
+                        "weight": weight,
+                        "solve_weight": self.solve_weights[a],
+                    }
+                )
+        self.edge_capacity, self.edge_weight = edge_capacity, edge_weight
+
+        changed = self.__changed(
+            (self.node_capacity, node_capacity), (self.node_weight, node_weight)
+        )
+        sink_arcs = 2 * len(self.edge_arcs)
+        for i in changed.tolist():
+            weight = node_weight[i].item()
+            a = sink_arcs + i
+            self.solve_weights[a] = solve_weight(weight, self.ties[a])
+            self.sink_arcs[i].update(
+                {
+                    "capacity": node_capacity[i].item(),
+                    "weight": weight,
+                    "solve_weight": self.solve_weights[a],
+                }
+            )
+        self.node_capacity, self.node_weight = node_capacity, node_weight
+
+        if source is not None:
+            self.bind(source, flow)
+
+    def __changed(self, *pairs):
+        changed = None
+        for old, new in pairs:
+            if old is None:
+                return np.arange(len(new))
+            mask = old != new
+            changed = mask if changed is None else changed | mask
+        return np.flatnonzero(changed)
+
+    def bind(self, source, flow):
+        self.source = source
+        self.flow = flow
+        self.graph.nodes().get(source).update({"demand": -flow})
+        self.graph.nodes().get("sink").update({"demand": flow})
+        # Arcs into the source are closed instead of removed to keep the arc order
+        for u in self.graph.predecessors(source):
+            arc = self.graph[u][source]
+            self.in_arcs.update({u: arc["capacity"]})
+            arc.update({"capacity": 0})
+        sink_arc = self.graph[source].get("sink")
+        if sink_arc:
+            sink_arc.update({"capacity": sink_arc["capacity"] - 1})
+
+    def unbind(self):
+        if self.source is None:
+            return
+        source = self.source
+        self.graph.nodes().get(source).pop("demand", None)
+        self.graph.nodes().get("sink").pop("demand", None)
+        for u, capacity in self.in_arcs.items():
+            self.graph[u][source].update({"capacity": capacity})
+        self.in_arcs = dict()
+        sink_arc = self.graph[source].get("sink")
+        if sink_arc:
+            sink_arc.update({"capacity": sink_arc["capacity"] + 1})
+        self.source = None
+        self.flow = 0
+
+    def rebind(self, source, flow):
+        self.unbind()
+        self.bind(source, flow)
+
+    def arc_capacities(self):
+        capacities = np.concatenate(
+            (np.repeat(self.edge_capacity, 2), self.node_capacity)
+        )
+        if self.source is None:
+            return capacities
+        source = self.node_index[self.source]
+        capacities[self.arc_heads == source] = 0
+        capacities[2 * len(self.edge_arcs) :][self.servers == source] -= 1
+        return capacities
+
+    def snapshot(self):
+        # Standalone copy of the bound network, as used for the csv output
+        graph = self.graph.copy()
+        if self.source is None:
+            return graph
+        graph.remove_edges_from([(u, self.source) for u in self.in_arcs])
+        return nx.relabel_nodes(graph, {self.source: f"source_{self.source}"})
@@ -1,62 +1,225 @@
-import csv
+import hashlib
 import json
 import math
 import networkx as nx
 import os
+import pickle
 import random
 
-from functools import partial
-from pydrive.auth import GoogleAuth
-from pydrive.drive import GoogleDrive
+from concurrent.futures import ProcessPoolExecutor
 from matplotlib import pyplot as plt, animation
+from matplotlib.colors import to_rgba_array
 from networkx.drawing.nx_pydot import graphviz_layout
-from oauth2client.service_account import ServiceAccountCredentials
+from os.path import isfile, join
+
+from constants import LAYOUT_CACHE_VERSION, LAYOUT_SPRING_LIMIT
+from storage import GoogleDriveStorage, minimum_cost_files, upload_directory
+from substrate import save_pickle
+
+
+def layout_kind(graph, layout=None):
+    # Spring layouts are quadratic per iteration, large graphs default to spectral
+    if layout:
+        return layout
+    if graph.number_of_nodes() > LAYOUT_SPRING_LIMIT:
+        return "spectral"
+    return "spring"
+
+
+def compute_layout(graph, layout):
+    if layout == "circular":
+        return nx.circular_layout(graph)
+    if layout == "tree":
+        return graphviz_layout(graph, prog="dot")
+    if layout == "spectral":
+        # Eigenvectors of the Laplacian, sparse solver on large graphs
+        return nx.spectral_layout(graph)
+    return nx.spring_layout(graph, k=10)
+
+
+def structure_digest(graph):
+    # Hash of the nodes and edges only, attributes (loads, colors) do not matter
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(b"directed" if graph.is_directed() else b"undirected")
+    for node in sorted(repr(u) for u in graph.nodes()):
+        digest.update(f"n{node}\0".encode())
+    edges = (
+        (repr(u), repr(v)) if graph.is_directed() else tuple(sorted((repr(u), repr(v))))
+        for u, v in graph.edges()
+    )
+    for u, v in sorted(edges):
+        digest.update(f"e{u}\0{v}\0".encode())
+    return digest.hexdigest()
+
+
+def graph_layout(graph, layout=None, cache_dir=None):
+    """
+    Node positions of a graph. With a cache_dir they are reused from an on-disk
+    cache there, keyed by the layout kind and structure_digest of the graph.
+    """
+    layout = layout_kind(graph, layout)
+    cache_path = None
+    if cache_dir:
+        cache_path = join(
+            cache_dir,
+            f"{layout}_{structure_digest(graph)}.v{LAYOUT_CACHE_VERSION}.pickle",
+        )
+        if isfile(cache_path):
+            with open(cache_path, "rb") as cache_file:
+                return pickle.load(cache_file)
+    pos = compute_layout(graph, layout)
+    if cache_path:
+        save_pickle(cache_path, pos)
+    return pos
+
+
+def default_colors(graph):
+    # Colors set on the graph are kept, switches are green, servers blue, edges black
+    node_colors = [
+        values.get("color") or ("g" if values.get("is_switch", False) else "b")
+        for _, values in graph.nodes(data=True)
+    ]
+    edge_colors = [
+        values.get("color") or "k" for _, _, values in graph.edges(data=True)
+    ]
+    return node_colors, edge_colors
+
+
+def flow_steps(graph, flows):
+    """
+    Recoloring steps of the recorded flows as (node, edge, color), one step colors
+    the source of a flow then one step per edge it uses. Nodes and edges are
+    indices into graph.nodes() and graph.edges(), the other one is None.
+    """
+    node_index = {u: i for i, u in enumerate(graph.nodes())}
+    edge_index = dict()
+    for e, (u, v) in enumerate(graph.edges()):
+        edge_index.update({(u, v): e, (v, u): e})
+    cmap = plt.cm.get_cmap("hsv", 50)
+    for flow_counter, (source, edges) in enumerate(flows):
+        color = cmap(flow_counter)
+        yield node_index[source], None, color
+        for u, v in edges:
+            if (u, v) in edge_index:
+                yield None, edge_index[u, v], color
+
+
+def flow_colors(graph, flows):
+    # Node and edge colors once every recorded flow is drawn
+    node_colors, edge_colors = default_colors(graph)
+    for node, edge, color in flow_steps(graph, flows):
+        if edge is None:
+            node_colors[node] = color
+        else:
+            edge_colors[edge] = color
+    return node_colors, edge_colors
+
+
+def render_graph(graph, pos, layout, cache_dir, flows, title, path, with_labels):
+    # Final state of a DrawGraphs, run in the render process
+    if pos is None:
+        pos = graph_layout(graph, layout, cache_dir)
+    figure = plt.figure(figsize=(20, 10))
+    colors = dict()
+    if with_labels:
+        node_colors, edge_colors = flow_colors(graph, flows)
+        colors.update({"node_color": node_colors, "edge_color": edge_colors})
+    # Title first, nx.draw reuses the axes it creates
+    plt.title(title or "Figure 1")
+    nx.draw(graph, pos, with_labels=True, **colors)
+    create_directories(path)
+    figure.savefig(f"{path}.png")
+    plt.close(figure)
+
+
+def init_render_worker():
+    plt.switch_backend("agg")
+
+
+# Figures saved by DrawGraphs are rendered by a single background process
+RENDER_POOL = None
+RENDERS = list()
+
+
+def get_render_pool():
+    global RENDER_POOL
+    if RENDER_POOL is None:
+        RENDER_POOL = ProcessPoolExecutor(max_workers=1, initializer=init_render_worker)
+    return RENDER_POOL
+
+
+def finish_rendering():
+    # Waits for the saved figures, call before reading or uploading them
+    global RENDER_POOL
+    renders = list(RENDERS)
+    RENDERS.clear()
+    for render in renders:
+        render.result()
+    if RENDER_POOL is not None:
+        RENDER_POOL.shutdown(wait=True)
+        RENDER_POOL = None
 
 
 class DrawGraphs:
+    """
+    Records the flows mapped during a run, nothing is laid out or drawn until
+    draw(). Saved figures are rendered in a background process (wait for them with
+    finish_rendering), shown ones animate the flows by recoloring a single drawing.
+    Layouts are cached in cache_dir when one is given, see graph_layout.
+    """
+
     excluded_attributes = ["color", "is_switch"]
 
-    def __init__(self, graph, with_labels=False, title=None, layout=None, path=None):
-        self.figure_number = 0
+    def __init__(
+        self,
+        graph,
+        with_labels=False,
+        title=None,
+        layout=None,
+        path=None,
+        cache_dir=None,
+    ):
         self.graph = graph
         self.title = title
         self.with_labels = with_labels
-        self.figure = None
-        self.ani = list()
+        self.layout = layout
         self.path = path
-        self.cmap = plt.cm.get_cmap("hsv", 50)
-        self.flow_counter = 0
-        self.__generate_graph_position(layout)
-        self.add_graph()
-
-    def __generate_graph_position(self, layout):
-        if layout == "circular":
-            self.pos = nx.circular_layout(self.graph)
-        elif layout == "tree":
-            self.pos = graphviz_layout(self.graph, prog="dot")
-        else:
-            self.pos = nx.spring_layout(self.graph, k=10)
+        self.cache_dir = cache_dir
+        self.flows = list()
+        self.ani = list()
+        self.__pos = None
+
+    @property
+    def pos(self):
+        # Computed on first use and kept for every later drawing
+        if self.__pos is None:
+            self.__pos = graph_layout(self.graph, self.layout, self.cache_dir)
+        return self.__pos
 
     def draw(self):
         if self.path:
-            create_directories(self.path)
-            plt.savefig(f"{self.path}.png")
-            plt.clf()
+            RENDERS.append(
+                get_render_pool().submit(
+                    render_graph,
+                    self.graph,
+                    self.__pos,
+                    self.layout,
+                    self.cache_dir,
+                    self.flows,
+                    self.title,
+                    self.path,
+                    self.with_labels,
+                )
+            )
         else:
+            figure = self.__animate()
             plt.show()
-        self.figure_number = 0
+            # Headless backends return right away, figures would pile up otherwise
+            plt.close(figure)
 
     def add_title(self, title=None):
         if title:
             self.title = title
-        plt.title(self.title)
-
-    def __add_figure_details(self):
-        self.figure_number += 1
-        self.figure = plt.figure(self.figure_number, figsize=(20, 10))
-        if not self.title:
-            self.title = f"Figure {self.figure_number}"
-        self.add_title()
 
     def __default_values(self, key):
         if key.lower() in ["capacity", "demand"]:
@@ -104,70 +267,49 @@ class DrawGraphs:
                 ]
             )
 
-    def __add_default_colors(self):
-        # Node colors
-        for _, values in self.graph.nodes(data=True):
-            if values.get("color", None):
-                continue
-            if values.get("is_switch", False):
-                values.update({"color": "g"})
+    def __animate(self):
+        # Nodes and edges are drawn once, every frame only recolors them
+        figure = plt.figure(figsize=(20, 10))
+        plt.title(self.title or "Figure 1")
+        node_colors, edge_colors = default_colors(self.graph)
+        if not self.with_labels:
+            nx.draw(self.graph, self.pos, with_labels=True)
+            return figure
+        nodes = nx.draw_networkx_nodes(self.graph, self.pos, node_color=node_colors)
+        edges = nx.draw_networkx_edges(self.graph, self.pos, edge_color=edge_colors)
+        nx.draw_networkx_labels(self.graph, self.pos)
+        node_colors = to_rgba_array(node_colors)
+        edge_colors = to_rgba_array(edge_colors)
+        steps = list(flow_steps(self.graph, self.flows))
+        if not steps:
+            return figure
+
+        def recolor(frame):
+            node, edge, color = steps[frame]
+            if edge is None:
+                node_colors[node] = color
+                nodes.set_facecolor(node_colors)
             else:
-                values.update({"color": "b"})
-
-        # Edge colors
-        for _, _, values in self.graph.edges(data=True):
-            if values.get("color", None):
-                continue
-            values.update({"color": "k"})
-
-    def __draw(self):
-        labels = dict()
-        if self.with_labels:
-            # self.__draw_table()
-            edge_color = nx.get_edge_attributes(self.graph, "color").values()
-            if edge_color:
-                labels.update({"edge_color": edge_color})
-            node_color = nx.get_node_attributes(self.graph, "color").values()
-            if node_color:
-                labels.update({"node_color": node_color})
-        nx.draw(self.graph, self.pos, with_labels=True, **labels)
-
-    def add_graph(self):
-        self.__add_figure_details()
-        self.__add_default_colors()
-        self.__draw()
-
-    def __init_animation(self):
-        pass
-
-    def __add_flow(self, updated_details, color, frame):
-        u, v = updated_details[frame]
-        if "sink" not in [u, v]:
-            self.graph[u][v]["color"] = color
-        self.figure.clear()
-        self.add_title()
-        self.__draw()
+                edge_colors[edge] = color
+                edges.set_color(edge_colors)
+            return nodes, edges
+
+        self.ani.append(
+            animation.FuncAnimation(
+                figure,
+                recolor,
+                frames=len(steps),
+                interval=1000,
+                repeat=False,
+            )
+        )
+        return figure
 
     def add_flow(self, flow_graph, source):
-        color = self.cmap(self.flow_counter)
-        self.graph.nodes().get(source).update({"color": color})
-        updated_details = list(flow_graph.edges()) + [(source, "sink")]
-        frames = len(flow_graph.edges()) + 1
-        if self.path:
-            for frame in range(frames):
-                self.__add_flow(updated_details, color, frame)
-        else:
-            self.ani.append(
-                animation.FuncAnimation(
-                    self.figure,
-                    partial(self.__add_flow, updated_details, color),
-                    frames=frames,
-                    interval=1000,
-                    repeat=False,
-                    init_func=self.__init_animation,
-                )
-            )
-        self.flow_counter += 1
+        # Only the edges are kept, placement never waits on matplotlib
+        self.flows.append(
+            (source, [(u, v) for u, v in flow_graph.edges() if "sink" not in [u, v]])
+        )
 
 
 def create_directories(path):
@@ -191,64 +333,6 @@ def from_min_cost_flow(flow_dict, flow_graph):
     return G, total_cost
 
 
-def write_to_csv(file_name, fields, data):
-    with open(file_name, "a") as csv_file:
-        writer = csv.DictWriter(csv_file, fields)
-        writer.writeheader()
-        writer.writerows(data)
-
-
-def save_flow_details(substrate_graph, flow_graph, flow, cost, path=None):
-    if not path:
-        return
-
-    path = f"{path}.csv"
-    create_directories(path)
-
-    # Write flow, cost
-    with open(path, "w") as csv_file:
-        csv_file.write(f"Flow: {flow}\n")
-        csv_file.write(f"Cost: {cost}\n")
-
-    if substrate_graph:
-        with open(path, "a") as csv_file:
-            csv_file.write("\n\nSubstrate Node Data\n")
-
-        # Write Node data
-        fields = set()
-        data = list()
-        for source, details in substrate_graph.nodes(data=True):
-            fields.update(details.keys())
-            data.append({"source": source, **details})
-        write_to_csv(path, ["source"] + list(fields), data)
-
-        with open(path, "a") as csv_file:
-            csv_file.write("\n\nSubstrate Edge Data\n")
-
-        # Write Edge data
-        fields = set()
-        data = list()
-        substrate_data = nx.to_dict_of_dicts(substrate_graph)
-        for source, values in substrate_data.items():
-            for dest, details in values.items():
-                fields.update(details.keys())
-                data.append({"source": source, "destination": dest, **details})
-        write_to_csv(path, ["source", "destination"] + list(fields), data)
-
-    if flow_graph:
-        with open(path, "a") as csv_file:
-            csv_file.write("\n\nFlow Data\n")
-
-        # Write flow dict
-        fields = ["source", "destination", "capacity", "weight", "load"]
-        data = list()
-        flow_data = nx.to_dict_of_dicts(flow_graph)
-        for source, values in flow_data.items():
-            for dest, details in values.items():
-                data.append({"source": source, "destination": dest, **details})
-        write_to_csv(path, fields, data)
-
-
 def get_google_drive_folder_id(topology):
     with open("config.json", "r") as config_file:
         config = json.load(config_file)
@@ -260,55 +344,23 @@ def get_google_drive_folder_id(topology):
     return folder_id
 
 
-def connect_to_gdrive():
-    gauth = GoogleAuth()
-    scope = ["https://www.googleapis.com/auth/drive"]
-    gauth.credentials = ServiceAccountCredentials.from_json_keyfile_name(
-        "client_secrets.json", scope
-    )
-    return GoogleDrive(gauth)
-
-
 def upload_to_google_drive(path, folder_id):
-    drive = connect_to_gdrive()
-    filename_prefix = "_".join(path.split("/")[1:])
-    for file in os.listdir(path):
-        gfile = drive.CreateFile(
-            {"title": f"{filename_prefix}_{file}", "parents": [{"id": folder_id}]}
-        )
-        gfile.SetContentFile(f"{path}/{file}")
-        gfile.Upload()
+    return upload_directory(GoogleDriveStorage(folder_id), path)
 
 
 def read_from_google_drive(folder_id):
-    drive = connect_to_gdrive()
-    files = drive.ListFile(
-        {"q": f"'{folder_id}' in parents and trashed=false"}
-    ).GetList()
-    min_cost = math.inf
-    min_files = list()
-    for file in files:
-        filename = file.get("title")
-        if filename.endswith(".csv"):
-            file_id = file.get("id")
-            gfile = drive.CreateFile({"id": file_id})
-            resp = gfile.GetContentString()
-            cost = resp.split("\n")[1].split(": ")[1]
-            if cost == "inf":
-                continue
-            cost = int(cost)
-            if cost == min_cost:
-                min_files.append(filename)
-            if cost < min_cost:
-                min_files = [filename]
-    return min_files
-
-
-def fetch_minimum_costs(folder_ids=None):
+    return minimum_cost_files(GoogleDriveStorage(folder_id))
+
+
+def fetch_minimum_costs(folder_ids=None, storage=GoogleDriveStorage):
+    """
+    Cheapest results files per configured folder, read from the stored manifests.
+    storage builds the backend of a folder, LocalStorage reads local directories.
+    """
     min_flow_dict = dict()
     if not folder_ids:
         with open("config.json", "r") as config_file:
             folder_ids = json.load(config_file)
     for flow, folder_id in folder_ids.items():
-        min_flow_dict.update({flow: read_from_google_drive(folder_id)})
+        min_flow_dict.update({flow: minimum_cost_files(storage(folder_id))})
     return min_flow_dict
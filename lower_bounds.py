@@ -0,0 +1,86 @@
+import numpy as np
+
+from scipy.sparse.csgraph import dijkstra
+
+from array_substrate import edge_graph
+from constants import BOUND_CHUNK_SIZE
+
+
+def residual_graph_matrix(network):
+    # Substrate arcs that can still carry flow, weighted by their cost
+    return edge_graph(
+        network.indptr,
+        network.indices,
+        network.adj_edges,
+        network.edge_weight,
+        network.edge_capacity > 0,
+    )
+
+
+def cheapest_units(unit_costs, capacities, flow):
+    # Cost of sending flow units to the cheapest sinks of every row
+    order = np.argsort(unit_costs, axis=1, kind="stable")
+    unit_costs = np.take_along_axis(unit_costs, order, axis=1)
+    capacities = np.take_along_axis(capacities, order, axis=1)
+    capacities = np.where(np.isfinite(unit_costs), np.maximum(capacities, 0), 0)
+    taken = np.clip(flow - (np.cumsum(capacities, axis=1) - capacities), 0, capacities)
+    costs = (np.where(taken > 0, unit_costs, 0) * taken).sum(axis=1)
+    costs[capacities.sum(axis=1) < flow] = np.inf
+    return costs
+
+
+def source_distances(network, rows=None):
+    """
+    Shortest path costs between servers (rows x servers) over the arcs that can
+    still carry flow. Arcs only close while a time slot fills up, so distances
+    computed earlier in the slot stay lower bounds of the current ones.
+    """
+    servers = network.servers
+    if rows is None:
+        rows = np.arange(len(servers))
+    distances = np.full((len(rows), len(servers)), np.inf)
+    graph = residual_graph_matrix(network)
+    for start in range(0, len(rows), BOUND_CHUNK_SIZE):
+        chunk = slice(start, start + BOUND_CHUNK_SIZE)
+        distances[chunk] = dijkstra(graph, indices=servers[rows[chunk]])[:, servers]
+    return distances
+
+
+def source_lower_bounds(network, flow, distances=None):
+    """
+    Lower bound on the min cost flow of every server (in network.servers order),
+    inf when the source can't be feasible. Edge capacities are relaxed, so each
+    unit costs the shortest path to a server plus that server's sink weight.
+    Precomputed (servers x servers) distances can be passed to skip Dijkstra.
+    """
+    servers = network.servers
+    bounds = np.full(len(servers), np.inf)
+    if not len(servers):
+        return bounds
+
+    # Same quick infeasibility checks as the min cost flow solvers
+    network.unbind()
+    capacities = network.arc_capacities()
+    negative_heads = np.bincount(
+        network.arc_heads[capacities < 0], minlength=len(network.nodes) + 1
+    )
+    feasible = negative_heads.sum() - negative_heads[servers] == 0
+    feasible &= network.node_capacity - 1 >= 0
+    if not feasible.any():
+        return bounds
+
+    graph = residual_graph_matrix(network) if distances is None else None
+    for start in range(0, len(servers), BOUND_CHUNK_SIZE):
+        rows = np.arange(start, min(start + BOUND_CHUNK_SIZE, len(servers)))
+        rows = rows[feasible[rows]]
+        if not len(rows):
+            continue
+        if distances is None:
+            unit_costs = dijkstra(graph, indices=servers[rows])[:, servers]
+        else:
+            unit_costs = distances[rows]
+        unit_costs = unit_costs + network.node_weight[None, :]
+        node_capacity = np.repeat(network.node_capacity[None, :], len(rows), axis=0)
+        node_capacity[np.arange(len(rows)), rows] -= 1
+        bounds[rows] = cheapest_units(unit_costs, node_capacity, flow)
+    return bounds
@@ -0,0 +1,429 @@
+import networkx as nx
+import numpy as np
+
+from math import inf
+from scipy.sparse.csgraph import dijkstra
+
+from constants import (
+    MAPPING_HOP_COST,
+    MAPPING_MAX_PASSES,
+    MAPPING_MAX_REPAIRS,
+    MAPPING_TOLERANCE,
+)
+
+
+class ServerPaths:
+    """
+    Shortest paths from the servers of a substrate, over its edge weights plus a
+    small cost per hop. They are kept until the edge weights change, so the
+    mappers of a run share them between workloads.
+    """
+
+    def __init__(self):
+        self.edge_weight = None
+        self.weights = None
+        self.distances = None
+        self.predecessors = None
+
+    def refresh(self, substrate, servers):
+        if self.edge_weight is not None and np.array_equal(
+            self.edge_weight, substrate.edge_weight
+        ):
+            return self
+        self.edge_weight = substrate.edge_weight.copy()
+        # A small cost per hop keeps paths short where weights are still 0
+        self.weights = self.edge_weight + MAPPING_HOP_COST
+        distances, self.predecessors = dijkstra(
+            substrate.weighted_graph(self.weights),
+            indices=servers,
+            return_predecessors=True,
+        )
+        # Server to server distances, unreachable pairs get a finite penalty so
+        # that attraction sums stay comparable
+        self.distances = distances[:, servers]
+        finite = self.distances[np.isfinite(self.distances)]
+        penalty = (finite.max() if len(finite) else 0) * len(servers) + 1
+        self.distances[~np.isfinite(self.distances)] = penalty
+        return self
+
+
+class WorkloadMapper:
+    """
+    Heuristic mapping of general workload graphs (trees, rings, all-to-all, ...)
+    onto the servers of a substrate at one time step, the quadratic assignment
+    problem the star workloads solve exactly with min cost flows. A workload node
+    takes its "weight" (default 1) of server capacity, a workload edge carries its
+    "weight" as demand along a path between the hosts of its ends. The cost is the
+    same as for stars, loads times the current node and edge weights.
+
+    Nodes are placed greedily, the one most connected to already placed nodes
+    first, then improved by moves and swaps. attraction[a, s] holds the edge cost
+    of node a on server s given the hosts of its neighbors, which makes the cost
+    change of any move or swap O(1) and the update after one O(degree x servers).
+    Pass the ServerPaths of the substrate to reuse them across workloads.
+
+    Capacity is evaluated incrementally too. local[a, s] holds the demand between
+    node a and its neighbors hosted on s, cut[s] the demand leaving server s. A
+    cut above the residual capacity of the server's edges (its uplink) is an
+    overload, which outweighs any cost change of a move or swap. While placing,
+    the demand to nodes still to place counts as cut in the share the server has
+    no room for. Demands that still can't be routed are repaired by moving one
+    end of the heaviest edge between the two hosts.
+    """
+
+    def __init__(self, substrate, current_time, paths=None):
+        self.substrate = substrate
+        self.servers = np.flatnonzero(~substrate.is_switch)
+        self.free = (substrate.node_capacity - substrate.node_load.at(current_time))[
+            self.servers
+        ]
+        self.node_cost = substrate.node_weight[self.servers]
+        self.edge_free = substrate.edge_capacity - substrate.edge_load.at(current_time)
+        uplink = np.bincount(
+            substrate.edge_u, self.edge_free, substrate.node_count
+        ) + np.bincount(substrate.edge_v, self.edge_free, substrate.node_count)
+        self.uplink = uplink[self.servers]
+        paths = (paths or ServerPaths()).refresh(substrate, self.servers)
+        self.weights = paths.weights
+        self.distances = paths.distances
+        self.predecessors = paths.predecessors
+        self.penalty = 0
+
+    def map(self, workload):
+        """
+        Mapping of a workload graph as (mapping graph, cost, source), the mapping
+        graph in the format of from_min_cost_flow + update_flow_graph (loaded edges
+        and servers with their "load") and source the host of the workload's first
+        node. (None, inf, None) when it doesn't fit.
+        """
+        nodes = list(workload.nodes())
+        if not nodes:
+            return None, inf, None
+        index = {a: i for i, a in enumerate(nodes)}
+        demand = np.array(
+            [values.get("weight", 1) for _, values in workload.nodes(data=True)]
+        )
+        adjacency = np.zeros((len(nodes), len(nodes)))
+        for a, b, weight in workload.edges(data="weight", default=1):
+            if a != b:
+                adjacency[index[a], index[b]] += weight
+                adjacency[index[b], index[a]] += weight
+        # Larger than the cost change of any move or swap, per unit of overload
+        self.penalty = (adjacency.sum() + 1) * (self.distances.max() + 1) + (
+            demand.sum() + 1
+        ) * (np.abs(self.node_cost).max(initial=0) + 1)
+        state = self.place(demand, adjacency)
+        if state is None:
+            return None, inf, None
+        self.improve(demand, adjacency, *state)
+        hosts, free = state[:2]
+        tried = set()
+        for _ in range(MAPPING_MAX_REPAIRS + 1):
+            edge_load, failed = self.route(adjacency, hosts)
+            if failed is None:
+                return self.mapping(hosts, free, edge_load)
+            if not self.repair(demand, adjacency, *state, failed, tried):
+                break
+        return None, inf, None
+
+    def overload(self, cut, servers=slice(None)):
+        return np.maximum(cut - self.uplink[servers], 0)
+
+    def move(self, adjacency, hosts, attraction, local, cut, a, server):
+        previous = hosts[a]
+        hosts[a] = server
+        neighbors = np.flatnonzero(adjacency[a])
+        if not len(neighbors):
+            return
+        # Edges to the neighbors placed so far, before local changes
+        placed = local[a].sum()
+        if previous >= 0:
+            cut[previous] += 2 * local[a, previous] - placed
+        else:
+            cut += local[a]
+        cut[server] += placed - 2 * local[a, server]
+        change = self.distances[server]
+        if previous >= 0:
+            change = change - self.distances[previous]
+            local[neighbors, previous] -= adjacency[neighbors, a]
+        local[neighbors, server] += adjacency[neighbors, a]
+        attraction[neighbors] += adjacency[neighbors, a][:, None] * change[None, :]
+
+    def reach(self, reaches, node_demand, edge_demand):
+        """
+        Cheapest cost, from every server, of hosting a neighbor with node_demand
+        joined by edge_demand somewhere with room for it, capacities left aside.
+        Cached per demand pair, workloads only have a few distinct ones.
+        """
+        key = (node_demand, edge_demand)
+        if key not in reaches:
+            costs = node_demand * self.node_cost[None, :] + edge_demand * self.distances
+            costs[:, self.free < node_demand] = inf
+            reaches.update({key: costs.min(axis=1)})
+        return reaches.get(key)
+
+    def place(self, demand, adjacency):
+        node_count = len(demand)
+        hosts = np.full(node_count, -1)
+        free = self.free.astype(float)
+        attraction = np.zeros((node_count, len(self.servers)))
+        local = np.zeros((node_count, len(self.servers)))
+        cut = np.zeros(len(self.servers))
+        degree = adjacency.sum(axis=1)
+        connection = np.zeros(node_count)
+        placed = np.zeros(node_count, dtype=bool)
+        reaches = dict()
+        for _ in range(node_count):
+            # Most connected to the placed nodes, ties broken by degree
+            priority = np.where(placed, -inf, connection * (degree.max() + 1) + degree)
+            a = np.argmax(priority).item()
+            costs = demand[a] * self.node_cost + attraction[a]
+            # Looking ahead to the neighbors still to place keeps hubs (a star's
+            # center of weight 0) from landing far from every cheap server
+            for b in np.flatnonzero((adjacency[a] > 0) & ~placed).tolist():
+                costs = costs + self.reach(reaches, demand[b], adjacency[a, b])
+            costs = costs + self.penalty * self.placement_overload(
+                demand, adjacency, free, local, cut, placed, a
+            )
+            costs[free < demand[a]] = inf
+            server = np.argmin(costs).item()
+            if costs[server] == inf:
+                return None
+            self.move(adjacency, hosts, attraction, local, cut, a, server)
+            free[server] -= demand[a]
+            placed[a] = True
+            connection += adjacency[a]
+        return hosts, free, attraction, local, cut
+
+    def expected_cut(self, cut, pending, frontier, free):
+        # Demand to the nodes still to place (pending) is cut in the share of the
+        # frontier, the nodes it leads to, that the server has no room for
+        with np.errstate(divide="ignore", invalid="ignore"):
+            share = np.where(frontier > 0, 1 - free / frontier, 0)
+        return cut + pending * np.clip(share, 0, 1)
+
+    def placement_overload(self, demand, adjacency, free, local, cut, placed, a):
+        """
+        Change of the total expected overload when placing a on every server. a
+        leaves the frontier of every server, the edges to its placed neighbors
+        become cut unless they share its server, which gains a's other neighbors.
+        """
+        unplaced = ~placed
+        pending = local[unplaced].sum(axis=0)
+        frontier = demand[unplaced] @ (local[unplaced] > 0)
+        before = self.overload(self.expected_cut(cut, pending, frontier, free))
+        hosted = local[a] > 0
+        frontier = frontier - demand[a] * hosted
+        others = (
+            self.overload(
+                self.expected_cut(cut + local[a], pending - local[a], frontier, free)
+            )
+            - before
+        )
+        neighbors = np.flatnonzero((adjacency[a] > 0) & unplaced)
+        neighbors = neighbors[neighbors != a]
+        own = (
+            self.overload(
+                self.expected_cut(
+                    cut + local[a].sum() - local[a],
+                    pending - local[a] + adjacency[a, neighbors].sum(),
+                    frontier + demand[neighbors] @ (local[neighbors] == 0),
+                    free - demand[a],
+                )
+            )
+            - before
+        )
+        return own + others.sum() - others
+
+    def move_changes(self, demand, adjacency, hosts, free, attraction, local, cut, a):
+        # Cost change of moving a to every server, overloads included
+        p = hosts[a]
+        current = demand[a] * self.node_cost[p] + attraction[a, p]
+        moves = demand[a] * self.node_cost + attraction[a] - current
+        degree = adjacency[a].sum()
+        overload = (
+            self.overload(cut[p] + 2 * local[a, p] - degree, p)
+            - self.overload(cut[p], p)
+            + self.overload(cut + degree - 2 * local[a])
+            - self.overload(cut)
+        )
+        moves = moves + self.penalty * overload
+        moves[free < demand[a]] = inf
+        moves[p] = inf
+        return moves, current
+
+    def improve(self, demand, adjacency, hosts, free, attraction, local, cut):
+        # First improvement local search, best move or swap of every node in turn
+        node_count = len(demand)
+        rows = np.arange(node_count)
+        degree = adjacency.sum(axis=1)
+        for _ in range(MAPPING_MAX_PASSES):
+            improved = False
+            for a in range(node_count):
+                p = hosts[a]
+                moves, current = self.move_changes(
+                    demand, adjacency, hosts, free, attraction, local, cut, a
+                )
+                server = np.argmin(moves).item()
+
+                # Swapping a (on p) with every b (on q), the a-b edge is counted
+                # twice by the two moves while its length stays the same. It also
+                # stays cut, which the cuts of p and q count twice as well
+                q = hosts
+                swaps = (
+                    demand[a] * self.node_cost[q]
+                    + attraction[a, q]
+                    - current
+                    + demand * (self.node_cost[p] - self.node_cost[q])
+                    + attraction[:, p]
+                    - attraction[rows, q]
+                    + 2 * adjacency[a] * self.distances[p, q]
+                )
+                cut_p = (
+                    cut[p]
+                    - degree[a]
+                    + 2 * local[a, p]
+                    + degree
+                    - 2 * local[:, p]
+                    + 2 * adjacency[a]
+                )
+                cut_q = (
+                    cut[q]
+                    + degree[a]
+                    - 2 * local[a, q]
+                    - degree
+                    + 2 * local[rows, q]
+                    + 2 * adjacency[a]
+                )
+                swaps = swaps + self.penalty * (
+                    self.overload(cut_p, p)
+                    - self.overload(cut[p], p)
+                    + self.overload(cut_q, q)
+                    - self.overload(cut[q], q)
+                )
+                swaps[
+                    (q == p)
+                    | (free[p] + demand[a] - demand < 0)
+                    | (free[q] + demand - demand[a] < 0)
+                ] = inf
+                b = np.argmin(swaps).item()
+
+                if min(moves[server], swaps[b]) >= -MAPPING_TOLERANCE:
+                    continue
+                improved = True
+                if moves[server] <= swaps[b]:
+                    free[p] += demand[a]
+                    free[server] -= demand[a]
+                    self.move(adjacency, hosts, attraction, local, cut, a, server)
+                else:
+                    q = hosts[b]
+                    free[p] += demand[a] - demand[b]
+                    free[q] += demand[b] - demand[a]
+                    self.move(adjacency, hosts, attraction, local, cut, a, q)
+                    self.move(adjacency, hosts, attraction, local, cut, b, p)
+            if not improved:
+                break
+
+    def repair(
+        self, demand, adjacency, hosts, free, attraction, local, cut, pair, tried
+    ):
+        """
+        Moves one end of the heaviest workload edge between the hosts of a demand
+        that couldn't be routed, next to the other end if it fits there and to its
+        cheapest other server otherwise. Moves already tried are not repeated.
+        False when no end can move.
+        """
+        p, q = pair
+        on_p, on_q = hosts == p, hosts == q
+        between = adjacency * (np.outer(on_p, on_q) | np.outer(on_q, on_p))
+        a, b = np.unravel_index(np.argmax(between), between.shape)
+        if between[a, b] == 0:
+            return False
+        # The lighter end moves first, it is the more likely to fit elsewhere
+        for x, y in sorted([(a, b), (b, a)], key=lambda ends: demand[ends[0]]):
+            moves, _ = self.move_changes(
+                demand, adjacency, hosts, free, attraction, local, cut, x
+            )
+            for server in range(len(self.servers)):
+                if (x, server) in tried:
+                    moves[server] = inf
+            server = hosts[y] if moves[hosts[y]] < inf else np.argmin(moves).item()
+            if moves[server] == inf:
+                continue
+            tried.add((x, server))
+            free[hosts[x]] += demand[x]
+            free[server] -= demand[x]
+            self.move(adjacency, hosts, attraction, local, cut, x, server)
+            return True
+        return False
+
+    def path(self, p, q, predecessors):
+        # Edge ids from servers[p] to servers[q] along a predecessor row
+        target = self.servers[q]
+        source = self.servers[p]
+        nodes = self.substrate.nodes
+        edges = list()
+        while target != source:
+            u = predecessors[target]
+            if u < 0:
+                return None
+            edges.append(self.substrate.edge_id(nodes[u], nodes[target]))
+            target = u
+        return edges
+
+    def route(self, adjacency, hosts):
+        """
+        Demands between hosts, largest first, along shortest paths with room left.
+        Returns (edge loads, None), or (None, (p, q)) for the first pair of hosts
+        whose demand doesn't fit.
+        """
+        a, b = np.nonzero(np.triu(adjacency))
+        p, q = np.minimum(hosts[a], hosts[b]), np.maximum(hosts[a], hosts[b])
+        cut = p != q
+        pairs, pair_demands = np.unique(
+            p[cut] * len(self.servers) + q[cut], return_inverse=True
+        )
+        pair_demands = np.bincount(pair_demands, adjacency[a, b][cut], len(pairs))
+        edge_load = np.zeros(self.substrate.edge_count)
+        # Stable, equal demands keep the order of their host pairs
+        for pair in np.argsort(-pair_demands, kind="stable").tolist():
+            p, q = divmod(pairs[pair].item(), len(self.servers))
+            pair_demand = pair_demands[pair]
+            edges = self.path(p, q, self.predecessors[p])
+            if (
+                edges is None
+                or (self.edge_free[edges] - edge_load[edges] < pair_demand).any()
+            ):
+                # Shortest path is full, detour over the edges that still fit it
+                _, predecessors = dijkstra(
+                    self.open_graph(self.edge_free - edge_load >= pair_demand),
+                    indices=self.servers[p],
+                    return_predecessors=True,
+                )
+                edges = self.path(p, q, predecessors)
+                if edges is None:
+                    return None, (p, q)
+            edge_load[edges] += pair_demand
+        return edge_load, None
+
+    def mapping(self, hosts, free, edge_load):
+        node_load = self.free - free
+        substrate = self.substrate
+        mapping = nx.DiGraph()
+        for s in np.flatnonzero(node_load).tolist():
+            mapping.add_node(substrate.nodes[self.servers[s]], load=node_load[s].item())
+        for e in np.flatnonzero(edge_load).tolist():
+            mapping.add_edge(
+                substrate.nodes[substrate.edge_u[e]],
+                substrate.nodes[substrate.edge_v[e]],
+                load=edge_load[e].item(),
+                weight=substrate.edge_weight[e].item(),
+            )
+        cost = (edge_load * substrate.edge_weight).sum() + (
+            node_load * self.node_cost
+        ).sum()
+        source = substrate.nodes[self.servers[hosts[0]]]
+        return mapping, cost.item(), source
+
+    def open_graph(self, open_edges):
+        return self.substrate.weighted_graph(self.weights, open_edges)
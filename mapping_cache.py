@@ -0,0 +1,56 @@
+import hashlib
+
+from collections import OrderedDict
+
+
+class MappingCache:
+    """
+    LRU cache of candidate mappings. Entries are keyed on the workload (flow, edge
+    demand), how the mappings were fetched and a digest of the residual
+    capacities and weights the flow network was built from, so a hit is only
+    possible while the substrate state is unchanged.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, network, flow, *details):
+        digest = hashlib.blake2b(digest_size=16)
+        for values in [
+            network.edge_capacity,
+            network.edge_weight,
+            network.node_capacity,
+            network.node_weight,
+        ]:
+            digest.update(values.tobytes())
+        return (flow, network.edge_demand, *details, digest.hexdigest())
+
+    def get(self, key):
+        mappings = self.entries.get(key)
+        if mappings is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return mappings
+
+    def put(self, key, mappings):
+        self.entries.update({key: mappings})
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self.entries),
+            "hit_rate": self.hits / lookups if lookups else 0,
+        }
@@ -0,0 +1,122 @@
+import cProfile
+import json
+import time
+
+from collections import Counter, defaultdict
+from contextlib import nullcontext
+from functools import wraps
+
+# Returned for every phase while profiling is off, so instrumented code only pays
+# for an attribute lookup and a no-op context manager
+DISABLED_PHASE = nullcontext()
+
+
+class Phase:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.timings[self.name] += time.perf_counter() - self.start
+        self.profiler.calls[self.name] += 1
+        return False
+
+
+class Profiler:
+    """
+    Per-phase wall time and event counters of a run. Phases nest, so their times
+    are inclusive. Only the calling process is measured, solves done in worker
+    processes are not counted.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.timings = defaultdict(float)
+        self.calls = Counter()
+        self.counters = Counter()
+        self.cprofile = None
+        self.started = None
+
+    def reset(self):
+        self.timings.clear()
+        self.calls.clear()
+        self.counters.clear()
+
+    def start(self, cprofile=False):
+        self.enabled = True
+        self.started = time.perf_counter()
+        if cprofile:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    def stop(self):
+        if self.cprofile:
+            self.cprofile.disable()
+        if self.started is not None:
+            self.timings["total"] += time.perf_counter() - self.started
+            self.calls["total"] += 1
+            self.started = None
+        self.enabled = False
+
+    def phase(self, name):
+        if not self.enabled:
+            return DISABLED_PHASE
+        return Phase(self, name)
+
+    def timed(self, name):
+        # Decorator form of phase(), checked on every call
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with Phase(self, name):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            self.counters[name] += amount
+
+    def summary(self):
+        return {
+            "phases": {
+                name: {"seconds": seconds, "calls": self.calls[name]}
+                for name, seconds in sorted(
+                    self.timings.items(), key=lambda item: -item[1]
+                )
+            },
+            "counters": dict(sorted(self.counters.items())),
+        }
+
+    def print_summary(self):
+        summary = self.summary()
+        total = self.timings.get("total", 0)
+        print(f"{'phase':<24}{'seconds':>12}{'calls':>10}{'share':>8}")
+        for name, values in summary["phases"].items():
+            share = values["seconds"] / total if total else 0
+            print(
+                f"{name:<24}{values['seconds']:>12.4f}{values['calls']:>10}"
+                f"{share:>8.1%}"
+            )
+        for name, value in summary["counters"].items():
+            print(f"{name:<24}{value:>12}")
+
+    def dump(self, path):
+        # JSON summary for .json paths, cProfile stats (pstats format) otherwise
+        if path.endswith(".json"):
+            with open(path, "w") as profile_file:
+                json.dump(self.summary(), profile_file, indent=2)
+        elif self.cprofile:
+            self.cprofile.dump_stats(path)
+
+
+profiler = Profiler()
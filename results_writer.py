@@ -0,0 +1,186 @@
+import json
+import numpy as np
+import os
+import zipfile
+
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from math import inf
+
+from constants import RESULTS_CHUNK_SIZE, RESULTS_MANIFEST
+
+# Columns of the placements (one row per workload) and of the edge loads (one row
+# per loaded arc of a placement)
+PLACEMENT_FIELDS = [
+    "workload",
+    "time",
+    "start_time",
+    "end_time",
+    "flow",
+    "source",
+    "cost",
+]
+EDGE_FIELDS = ["workload", "u", "v", "load", "weight"]
+SNAPSHOT_FIELDS = ["workload", "node_load", "edge_load", "node_weight", "edge_weight"]
+
+
+def write_arrays(path, prefix, arrays):
+    # New members are appended to the archive, earlier chunks are never rewritten
+    with zipfile.ZipFile(path, mode="a", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, array in arrays.items():
+            with archive.open(
+                f"{prefix}/{name}.npy", mode="w", force_zip64=True
+            ) as member:
+                np.lib.format.write_array(member, np.asarray(array), allow_pickle=False)
+
+
+class ResultsWriter:
+    """
+    Append-only columnar results of a run, a single .npz archive with one member
+    per column and chunk. Placements are buffered and every RESULTS_CHUNK_SIZE of
+    them are appended by a background thread, substrate snapshots are only kept
+    when asked for. Close (or leave the with block) to write the last chunk and
+    the run's manifest, see write_manifest.
+    """
+
+    def __init__(self, path, substrate=None, chunk_size=RESULTS_CHUNK_SIZE):
+        self.path = f"{path}.npz"
+        self.chunk_size = chunk_size
+        self.substrate = substrate
+        self.chunk_count = 0
+        self.workload_count = 0
+        self.placed_count = 0
+        self.min_cost = inf
+        self.buffers = defaultdict(list)
+        self.futures = list()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        # A single writer thread keeps the chunks in order
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        if substrate is not None:
+            self.submit(
+                "substrate",
+                {
+                    "nodes": np.array([str(u) for u in substrate.nodes]),
+                    "edge_u": substrate.edge_u,
+                    "edge_v": substrate.edge_v,
+                    "node_capacity": substrate.node_capacity,
+                    "edge_capacity": substrate.edge_capacity,
+                },
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def submit(self, prefix, arrays):
+        self.futures.append(
+            self.executor.submit(write_arrays, self.path, prefix, arrays)
+        )
+        # Surface write errors early instead of at close
+        while self.futures and self.futures[0].done():
+            self.futures.pop(0).result()
+
+    def record(self, workload, time, flow, source, cost, flow_graph=None):
+        """
+        Buffers the placement of a workload (start_time, end_time, leaf_count) at
+        time, with the loads of its flow graph. Unplaced workloads have no source
+        and an infinite cost. Returns the workload id.
+        """
+        workload_id = self.workload_count
+        self.workload_count += 1
+        start_time, end_time, _ = workload
+        for key, value in zip(
+            PLACEMENT_FIELDS,
+            [workload_id, time, start_time, end_time, flow, source, cost],
+        ):
+            self.buffers[key].append(value)
+        if cost < inf:
+            self.placed_count += 1
+            self.min_cost = min(self.min_cost, cost)
+        if flow_graph:
+            for u, v, values in flow_graph.edges(data=True):
+                for key, value in zip(
+                    EDGE_FIELDS,
+                    [workload_id, u, v, values.get("load"), values.get("weight")],
+                ):
+                    self.buffers[f"edge_{key}"].append(value)
+        if len(self.buffers["workload"]) >= self.chunk_size:
+            self.flush()
+        return workload_id
+
+    def snapshot(self, workload_id, time):
+        # Substrate loads and weights after a placement, copied as they change later
+        for key, value in zip(
+            SNAPSHOT_FIELDS,
+            [
+                workload_id,
+                self.substrate.node_load.at(time).copy(),
+                self.substrate.edge_load.at(time).copy(),
+                self.substrate.node_weight.copy(),
+                self.substrate.edge_weight.copy(),
+            ],
+        ):
+            self.buffers[f"snapshot_{key}"].append(value)
+
+    def flush(self):
+        if not self.buffers:
+            return
+        arrays = dict()
+        for key, values in self.buffers.items():
+            if key in ["source", "edge_u", "edge_v"]:
+                # Node names may mix types, unplaced workloads have no source
+                arrays.update(
+                    {key: np.array(["" if v is None else str(v) for v in values])}
+                )
+            elif key.startswith("snapshot_") and key != "snapshot_workload":
+                arrays.update({key: np.stack(values)})
+            else:
+                arrays.update({key: np.array(values)})
+        self.buffers = defaultdict(list)
+        self.submit(f"chunk_{self.chunk_count:06d}", arrays)
+        self.chunk_count += 1
+
+    def close(self):
+        if self.executor is None:
+            return
+        self.flush()
+        self.executor.shutdown(wait=True)
+        self.executor = None
+        for future in self.futures:
+            future.result()
+        self.futures = list()
+        write_manifest(self.path, self.summary())
+
+    def summary(self):
+        return {
+            "workloads": self.workload_count,
+            "placed": self.placed_count,
+            "min_cost": self.min_cost if self.min_cost < inf else None,
+        }
+
+
+def read_manifest(path):
+    if not os.path.isfile(path):
+        return dict()
+    with open(path, "r") as manifest_file:
+        return json.load(manifest_file)
+
+
+def write_manifest(results_path, summary):
+    """
+    Records the summary of a results file in a manifest next to it, so the costs
+    of stored runs are known without downloading them. Every results file has its
+    own manifest, runs sharing a directory never rewrite each other's entries.
+    """
+    manifest_path = f"{results_path}.{RESULTS_MANIFEST}"
+    temp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as manifest_file:
+        json.dump({os.path.basename(results_path): summary}, manifest_file, indent=2)
+    os.replace(temp_path, manifest_path)
@@ -0,0 +1,107 @@
+import networkx as nx
+import numpy as np
+
+from scipy.sparse.csgraph import dijkstra
+
+
+class ShortestPathIndex:
+    """
+    Shortest path trees from the servers of a substrate over all of its edges,
+    built lazily and kept across time steps. Trees only depend on the edge
+    weights, a weight change drops the trees it can affect. A star workload is
+    routed along the tree of its center whenever no edge capacity binds, which is
+    then an optimal min cost flow.
+    """
+
+    def __init__(self, substrate):
+        self.substrate = substrate
+        self.edge_u = substrate.edge_u
+        self.edge_v = substrate.edge_v
+        self.edge_weight = None
+        self.graph = None
+        # Source node index -> (distances, predecessors)
+        self.trees = dict()
+
+    def refresh(self, edge_weight):
+        if self.edge_weight is not None and np.array_equal(
+            self.edge_weight, edge_weight
+        ):
+            return
+        if self.edge_weight is not None and self.trees:
+            changed = np.flatnonzero(self.edge_weight != edge_weight)
+            u, v, weight = (
+                self.edge_u[changed],
+                self.edge_v[changed],
+                edge_weight[changed],
+            )
+            for source, (distances, predecessors) in list(self.trees.items()):
+                # A tree survives if it uses none of the changed edges and none of
+                # them became a shortcut
+                if (
+                    (predecessors[v] == u).any()
+                    or (predecessors[u] == v).any()
+                    or (distances[u] + weight < distances[v]).any()
+                    or (distances[v] + weight < distances[u]).any()
+                ):
+                    del self.trees[source]
+        else:
+            self.trees = dict()
+        self.edge_weight = edge_weight.copy()
+        self.graph = self.substrate.weighted_graph(self.edge_weight)
+
+    def tree(self, source):
+        tree = self.trees.get(source)
+        if tree is None:
+            tree = dijkstra(self.graph, indices=source, return_predecessors=True)
+            self.trees.update({source: tree})
+        return tree
+
+    def route(self, network):
+        """
+        Flow dict of the bound network when its optimum follows the shortest path
+        tree of the source, None when a min cost flow solve is needed instead.
+        Raises nx.NetworkXUnfeasible when even uncapacitated edges can't fit it.
+        """
+        if self.edge_weight is None or network.source is None:
+            return None
+        if (self.edge_weight < 0).any() or (network.node_weight < 0).any():
+            return None
+        capacities = network.arc_capacities()
+        if (capacities < 0).any():
+            return None
+
+        source = network.node_index[network.source]
+        distances, predecessors = self.tree(source)
+        servers = network.servers
+        sink_capacity = capacities[2 * len(network.edge_arcs) :]
+        unit_costs = distances[servers] + network.node_weight
+        units = np.zeros(len(servers), dtype=np.int64)
+        remaining = network.flow
+        for i in np.argsort(unit_costs, kind="stable").tolist():
+            if remaining == 0 or unit_costs[i] == np.inf:
+                break
+            units[i] = min(remaining, sink_capacity[i])
+            remaining -= units[i]
+        if remaining > 0:
+            raise nx.NetworkXUnfeasible("no flow satisfies all node demands")
+
+        labels = network.nodes
+        arc_flow = dict()
+        for i in np.flatnonzero(units).tolist():
+            u = servers[i].item()
+            while u != source:
+                arc = self.substrate.arc_id(labels[predecessors[u]], labels[u])
+                arc_flow.update({arc: arc_flow.get(arc, 0) + units[i].item()})
+                if arc_flow[arc] > capacities[arc]:
+                    # Capacity binds, the tree isn't enough
+                    return None
+                u = predecessors[u].item()
+
+        flow_dict = {label: dict() for label in labels}
+        flow_dict.update({"sink": dict()})
+        tails, heads = network.arc_tails, network.arc_heads
+        for arc, load in arc_flow.items():
+            flow_dict[labels[tails[arc]]].update({labels[heads[arc]]: load})
+        for i in np.flatnonzero(units).tolist():
+            flow_dict[labels[servers[i]]].update({"sink": units[i].item()})
+        return flow_dict
@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from math import inf
+from os.path import isfile, join
+
+from constants import RESULTS_MANIFEST, UPLOAD_BACKOFF, UPLOAD_RETRIES, UPLOAD_WORKERS
+from results_writer import read_manifest
+
+
+def connect_to_gdrive():
+    # Google client libraries are only needed once a drive is used, LocalStorage
+    # works without them
+    from oauth2client.service_account import ServiceAccountCredentials
+    from pydrive.auth import GoogleAuth
+    from pydrive.drive import GoogleDrive
+
+    gauth = GoogleAuth()
+    scope = ["https://www.googleapis.com/auth/drive"]
+    gauth.credentials = ServiceAccountCredentials.from_json_keyfile_name(
+        "client_secrets.json", scope
+    )
+    return GoogleDrive(gauth)
+
+
+class LocalStorage:
+    """
+    Artifact store in a local directory, same interface as GoogleDriveStorage so
+    runs can be stored and read back without credentials.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def upload(self, local_path, name):
+        # Copied next to the target and renamed, readers never see a partial file
+        temp_path = join(self.root, f".{name}.{os.getpid()}.tmp")
+        shutil.copyfile(local_path, temp_path)
+        os.replace(temp_path, join(self.root, name))
+
+    def names(self):
+        return sorted(
+            name
+            for name in os.listdir(self.root)
+            if not name.startswith(".") and isfile(join(self.root, name))
+        )
+
+    def read_text(self, name):
+        with open(join(self.root, name), "r") as stored_file:
+            return stored_file.read()
+
+
+class GoogleDriveStorage:
+    # Files of a Google Drive folder (requires client_secrets.json)
+
+    def __init__(self, folder_id):
+        self.folder_id = folder_id
+        self.connections = threading.local()
+
+    @property
+    def drive(self):
+        # The http client is not thread safe, every upload thread gets its own
+        if not hasattr(self.connections, "drive"):
+            self.connections.drive = connect_to_gdrive()
+        return self.connections.drive
+
+    def upload(self, local_path, name):
+        gfile = self.drive.CreateFile(
+            {"title": name, "parents": [{"id": self.folder_id}]}
+        )
+        gfile.SetContentFile(local_path)
+        gfile.Upload()
+
+    def files(self):
+        return self.drive.ListFile(
+            {"q": f"'{self.folder_id}' in parents and trashed=false"}
+        ).GetList()
+
+    def names(self):
+        return sorted(file.get("title") for file in self.files())
+
+    def read_text(self, name):
+        for file in self.files():
+            if file.get("title") == name:
+                return self.drive.CreateFile({"id": file.get("id")}).GetContentString()
+        raise FileNotFoundError(name)
+
+
+class UploadQueue:
+    """
+    Uploads files to a storage backend from a pool of threads, retrying failed
+    uploads with exponential backoff. join() waits for every queued upload and
+    returns the ones that still failed as (local_path, name, error).
+    """
+
+    def __init__(
+        self,
+        storage,
+        workers=UPLOAD_WORKERS,
+        retries=UPLOAD_RETRIES,
+        backoff=UPLOAD_BACKOFF,
+    ):
+        self.storage = storage
+        self.retries = retries
+        self.backoff = backoff
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.futures = dict()
+
+    def upload(self, local_path, name):
+        for attempt in range(self.retries + 1):
+            try:
+                return self.storage.upload(local_path, name)
+            except Exception as error:
+                if attempt == self.retries:
+                    raise
+                print(f"Upload of {name} failed ({error}), retrying.")
+                time.sleep(self.backoff * 2**attempt)
+
+    def put(self, local_path, name):
+        future = self.executor.submit(self.upload, local_path, name)
+        self.futures.update({future: (local_path, name)})
+
+    def join(self):
+        failures = list()
+        for future in as_completed(self.futures):
+            local_path, name = self.futures.get(future)
+            try:
+                future.result()
+            except Exception as error:
+                failures.append((local_path, name, error))
+        self.futures = dict()
+        return failures
+
+    def close(self):
+        failures = self.join()
+        self.executor.shutdown(wait=True)
+        return failures
+
+
+def upload_directory(storage, path, workers=UPLOAD_WORKERS):
+    """
+    Uploads every file under path, prefixed with the names of its directories. The
+    results manifests found are merged into a single "<prefix>_<digest>_manifest.json",
+    uploaded once every other file made it. The digest of its entries keeps the
+    manifests of uploads to the same store apart. Returns the failed uploads.
+    """
+    queue = UploadQueue(storage, workers)
+    manifest = dict()
+    filename_prefix = "_".join(path.split("/")[1:])
+    for directory, _, files in os.walk(path):
+        directory_prefix = "_".join(directory.split("/")[1:])
+        for file in files:
+            if file.endswith(RESULTS_MANIFEST):
+                # Entries are renamed after the uploaded results files
+                for name, entry in read_manifest(join(directory, file)).items():
+                    manifest.update({f"{directory_prefix}_{name}": entry})
+                continue
+            queue.put(join(directory, file), f"{directory_prefix}_{file}")
+    failures = queue.join()
+    if manifest and not failures:
+        entries = json.dumps(manifest, indent=2, sort_keys=True)
+        digest = hashlib.blake2b(entries.encode(), digest_size=8).hexdigest()
+        manifest_path = join(path, f".{RESULTS_MANIFEST}")
+        with open(manifest_path, "w") as manifest_file:
+            manifest_file.write(entries)
+        queue.put(manifest_path, f"{filename_prefix}_{digest}_{RESULTS_MANIFEST}")
+        failures = queue.join()
+        os.remove(manifest_path)
+    queue.close()
+    for _, name, error in failures:
+        print(f"Upload of {name} failed: {error}")
+    return failures
+
+
+def read_manifests(storage):
+    # Every manifest of a store merged, keyed by the stored results file names
+    manifest = dict()
+    for name in storage.names():
+        if name.endswith(RESULTS_MANIFEST):
+            manifest.update(json.loads(storage.read_text(name)))
+    return manifest
+
+
+def minimum_cost_files(storage):
+    # Stored results files holding the cheapest placement, from the manifests only
+    min_cost = inf
+    min_files = list()
+    for name, entry in sorted(read_manifests(storage).items()):
+        cost = entry.get("min_cost")
+        if cost is None:
+            continue
+        if cost == min_cost:
+            min_files.append(name)
+        if cost < min_cost:
+            min_cost = cost
+            min_files = [name]
+    return min_files
@@ -1,12 +1,16 @@
+import hashlib
 import math
 import networkx as nx
-import random
+import numpy as np
+import os
+import pickle
 import re
 
-from itertools import combinations, groupby
+from os.path import basename, dirname, isfile, join
 
 from constants import (
     DEFAULT_BCUBE_0_NODE_COUNT,
+    DEFAULT_CAPACITY_RANGE,
     DEFAULT_EDGE_SWITCH_COUNT,
     DEFAULT_LEVEL,
     DEFAULT_LIFT_NO,
@@ -15,33 +19,95 @@ from constants import (
     DEFAULT_PROBABILITY,
     DEFAULT_SERVERS_PER_RACK,
     DEFAULT_STAGE_COUNT,
+    DEFAULT_WEIGHT_RANGE,
+    INTERNET_CACHE_DIR,
+    INTERNET_CACHE_VERSION,
 )
 
 
+def get_rng(seed=None):
+    # Seed may be None, an int or an existing np.random.Generator
+    if isinstance(seed, np.random.Generator):
+        return seed
+    return np.random.default_rng(seed)
+
+
+def random_attributes(rng, count):
+    capacities = rng.integers(
+        DEFAULT_CAPACITY_RANGE[0], DEFAULT_CAPACITY_RANGE[1] + 1, count
+    )
+    weights = rng.integers(DEFAULT_WEIGHT_RANGE[0], DEFAULT_WEIGHT_RANGE[1] + 1, count)
+    return capacities.tolist(), weights.tolist()
+
+
+def set_random_attributes(graph, rng, nodes=True, edges=True):
+    # Random capacity and weight on every node and edge, drawn in one go
+    if nodes:
+        capacities, weights = random_attributes(rng, graph.number_of_nodes())
+        for (_, values), capacity, weight in zip(
+            graph.nodes(data=True), capacities, weights
+        ):
+            values.update({"capacity": capacity, "weight": weight})
+    if edges:
+        capacities, weights = random_attributes(rng, graph.number_of_edges())
+        for (_, _, values), capacity, weight in zip(
+            graph.edges(data=True), capacities, weights
+        ):
+            values.update({"capacity": capacity, "weight": weight})
+    return graph
+
+
+def sample_pairs(rng, node_count, probability):
+    """
+    Indices of the node pairs (i < j, in combinations order) kept by an
+    Erdos-Renyi G(n, p) draw. Gaps between kept pairs are geometric, so the cost
+    is O(n + m) instead of a coin flip per pair.
+    """
+    pair_count = node_count * (node_count - 1) // 2
+    pairs = list()
+    last = -1
+    while last < pair_count:
+        size = max(1024, int(1.1 * (pair_count - last) * probability))
+        chunk = last + np.cumsum(rng.geometric(probability, size))
+        pairs.append(chunk[chunk < pair_count])
+        last = chunk[-1]
+    return np.concatenate(pairs)
+
+
+def pair_nodes(node_count, pairs):
+    # Pair index -> (i, j), rows of the upper triangle start at i * (2n - i - 1) / 2
+    rows = np.arange(node_count)
+    offsets = rows * (2 * node_count - rows - 1) // 2
+    u = np.searchsorted(offsets, pairs, side="right") - 1
+    v = pairs - offsets[u] + u + 1
+    return u, v
+
+
 def generate_random_graph(
-    node_count=DEFAULT_NODE_COUNT, probability=DEFAULT_PROBABILITY
+    node_count=DEFAULT_NODE_COUNT, probability=DEFAULT_PROBABILITY, seed=None
 ):
+    rng = get_rng(seed)
     G = nx.Graph()
-    edges = combinations(range(node_count), 2)
-    G.add_nodes_from(
-        range(node_count), capacity=random.randint(10, 50), weight=random.randint(1, 10)
-    )
+    G.add_nodes_from(range(node_count))
+    set_random_attributes(G, rng, edges=False)
     if probability <= 0:
         return G
     if probability >= 1:
-        return nx.complete_graph(node_count, create_using=G)
-    for _, node_edges in groupby(edges, key=lambda x: x[0]):
-        node_edges = list(node_edges)
-        random_edge = random.choice(node_edges)
-        G.add_edge(
-            *random_edge, capacity=random.randint(10, 50), weight=random.randint(1, 10)
-        )
-        for e in node_edges:
-            if random.random() < probability:
-                G.add_edge(
-                    *e, capacity=random.randint(10, 50), weight=random.randint(1, 10)
-                )
-    return G
+        pairs = np.arange(node_count * (node_count - 1) // 2)
+    else:
+        pairs = sample_pairs(rng, node_count, probability)
+    u, v = pair_nodes(node_count, pairs)
+    # Every node but the last also links to one random later node, which keeps the
+    # graph connected
+    first = np.arange(node_count - 1)
+    forward = rng.integers(first + 1, node_count) if len(first) else first
+    keys = np.unique(np.concatenate((u * node_count + v, first * node_count + forward)))
+    G.add_edges_from(zip((keys // node_count).tolist(), (keys % node_count).tolist()))
+    return set_random_attributes(G, rng, nodes=False)
+
+
+# Switches are nodes whose types start with one of these words
+SWITCH_TYPES = re.compile(r"\b(router|switch)\b", flags=re.IGNORECASE)
 
 
 def generate_internet_topology_graph(file_path):
@@ -51,39 +117,83 @@ def generate_internet_topology_graph(file_path):
         graph = nx.read_graphml(file_path)
         # Mark switches
         for u, values in graph.nodes(data=True):
-            if values.get("types") and any(
-                re.compile(r"\b({0})\b".format(word), flags=re.IGNORECASE).match(
-                    values.get("types")
-                )
-                for word in ["router", "switch"]
-            ):
-                graph.nodes().get(u).update({"is_switch": True})
+            if values.get("types") and SWITCH_TYPES.match(values.get("types")):
+                values.update({"is_switch": True})
         # Add capacity
+        nodes = graph.nodes()
         for u, v, values in graph.edges(data=True):
             raw_speed = values.get("LinkSpeedRaw", 5000000000) / 1000
             # Edge capacity set to link raw speed
             values.update({"capacity": raw_speed, "weight": raw_speed})
-            raw_speed = max(
-                dict(graph.nodes(data=True)).get(u).get("capacity", 0), raw_speed
-            )
             # Node capacity set to max of incident edge capacity
-            graph.nodes().get(u).update({"capacity": raw_speed, "weight": raw_speed})
-            raw_speed = max(
-                dict(graph.nodes(data=True)).get(v).get("capacity", 0), raw_speed
-            )
-            graph.nodes().get(v).update({"capacity": raw_speed, "weight": raw_speed})
+            raw_speed = max(nodes[u].get("capacity", 0), raw_speed)
+            nodes[u].update({"capacity": raw_speed, "weight": raw_speed})
+            raw_speed = max(nodes[v].get("capacity", 0), raw_speed)
+            nodes[v].update({"capacity": raw_speed, "weight": raw_speed})
         return graph
     print("Only gml/graphml files allowed in Internet Topology.")
 
 
+def file_digest(file_path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as topology_file:
+        for block in iter(lambda: topology_file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_internet_topology_graph(file_path, cache_dir=INTERNET_CACHE_DIR):
+    """
+    generate_internet_topology_graph through an on-disk pickle of the processed
+    graph. An entry is reused while the file's mtime and size are unchanged, or
+    its content hash still matches, and for the same INTERNET_CACHE_VERSION.
+    """
+    stat = os.stat(file_path)
+    cache_path = join(
+        cache_dir, f"{basename(file_path)}.v{INTERNET_CACHE_VERSION}.pickle"
+    )
+    digest = None
+    if isfile(cache_path):
+        with open(cache_path, "rb") as cache_file:
+            entry = pickle.load(cache_file)
+        if (entry["mtime"], entry["size"]) == (stat.st_mtime_ns, stat.st_size):
+            return entry["graph"]
+        digest = file_digest(file_path)
+        if entry["digest"] == digest:
+            graph = entry["graph"]
+            save_topology_cache(cache_path, graph, stat, digest)
+            return graph
+
+    graph = generate_internet_topology_graph(file_path)
+    if graph is not None:
+        save_topology_cache(cache_path, graph, stat, digest or file_digest(file_path))
+    return graph
+
+
+def save_pickle(path, data):
+    os.makedirs(dirname(path), exist_ok=True)
+    # Written next to the target and renamed, readers never see a partial file
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as pickle_file:
+        pickle.dump(data, pickle_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, path)
+
+
+def save_topology_cache(cache_path, graph, stat, digest):
+    save_pickle(
+        cache_path,
+        {
+            "mtime": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "digest": digest,
+            "graph": graph,
+        },
+    )
+
+
 def create_clos_server(graph, node_count, edge_switches):
     for i in range(node_count):
-        graph.add_edge(
-            i,
-            edge_switches[i % len(edge_switches)],
-            capacity=random.randint(10, 50),
-            weight=random.randint(1, 10),
-        )
+        graph.add_edge(i, edge_switches[i % len(edge_switches)])
 
 
 def create_clos_stage(graph, previous_nodes, crossbars, stage_no):
@@ -93,9 +203,7 @@ def create_clos_stage(graph, previous_nodes, crossbars, stage_no):
         node_list.append(node)
         graph.add_node(node, is_switch=True)
         for pre in previous_nodes:
-            graph.add_edge(
-                node, pre, capacity=random.randint(10, 50), weight=random.randint(1, 10)
-            )
+            graph.add_edge(node, pre)
     stage_no += 1
     return node_list, stage_no
 
@@ -105,6 +213,7 @@ def generate_clos_topology_graph(
     middle_stage_crossbars=DEFAULT_MIDDLE_STAGE_COUNT,
     number_of_stages=DEFAULT_STAGE_COUNT,
     edge_crossbars=DEFAULT_EDGE_SWITCH_COUNT,
+    seed=None,
 ):
     graph = nx.Graph()
     stage_no = 0
@@ -125,35 +234,18 @@ def generate_clos_topology_graph(
     ]
     # Create servers and connect to edge switches
     create_clos_server(graph, node_count, edges_switches)
-    # Add weights and capacity on nodes
-    for i, values in graph.nodes(data=True):
-        values.update(
-            {"capacity": random.randint(10, 50), "weight": random.randint(1, 10)}
-        )
-    return graph
+    # Add weights and capacity on nodes and edges
+    return set_random_attributes(graph, get_rng(seed))
 
 
 def create_bcube(graph, node_count, level, counter):
     server_list = list()
     if level == 0:
-        graph.add_node(
-            counter,
-            is_switch=True,
-            capacity=random.randint(10, 50),
-            weight=random.randint(1, 10),
-        )
+        graph.add_node(counter, is_switch=True)
         switch = counter
         counter += 1
         for _ in range(node_count):
-            graph.add_node(
-                counter, capacity=random.randint(10, 50), weight=random.randint(1, 10)
-            )
-            graph.add_edge(
-                switch,
-                counter,
-                capacity=random.randint(10, 50),
-                weight=random.randint(1, 10),
-            )
+            graph.add_edge(switch, counter)
             server_list.append(counter)
             counter += 1
         return server_list, counter
@@ -161,55 +253,34 @@ def create_bcube(graph, node_count, level, counter):
         servers, counter = create_bcube(graph, node_count, level - 1, counter)
         server_list.extend(servers)
     for i in range(node_count**level):
-        graph.add_node(
-            counter,
-            is_switch=True,
-            capacity=random.randint(10, 50),
-            weight=random.randint(1, 10),
-        )
+        graph.add_node(counter, is_switch=True)
         switch = counter
         for j in range(node_count):
-            graph.add_edge(
-                switch,
-                server_list[(node_count**level) * j + i],
-                capacity=random.randint(10, 50),
-                weight=random.randint(1, 10),
-            )
+            graph.add_edge(switch, server_list[(node_count**level) * j + i])
         counter += 1
     return server_list, counter
 
 
 def generate_bcube_topology_graph(
-    node_count=DEFAULT_BCUBE_0_NODE_COUNT, level=DEFAULT_LEVEL
+    node_count=DEFAULT_BCUBE_0_NODE_COUNT, level=DEFAULT_LEVEL, seed=None
 ):
     graph = nx.Graph()
     create_bcube(graph, node_count, level, 0)
-    return graph
+    return set_random_attributes(graph, get_rng(seed))
 
 
-def lift_graph(graph, lift):
+def lift_graph(graph, lift, rng):
     mapping = dict(zip(graph.nodes(), [lift * x for x in graph.nodes()]))
     graph = nx.relabel_nodes(graph, mapping)
     for n in list(graph.nodes()):
         for i in range(1, lift):
-            graph.add_node(
-                n + i,
-                is_switch=True,
-                capacity=random.randint(10, 50),
-                weight=random.randint(1, 10),
-            )
-    for u, v in list(graph.edges()):
+            graph.add_node(n + i, is_switch=True)
+    edges = list(graph.edges())
+    matchings = rng.permuted(np.tile(np.arange(lift), (len(edges), 1)), axis=1)
+    for (u, v), matching in zip(edges, matchings.tolist()):
         graph.remove_edge(u, v)
-        matching = list(range(lift))
-        random.shuffle(matching)
         for i in range(lift):
-            j = matching[i]
-            graph.add_edge(
-                u + i,
-                v + j,
-                capacity=random.randint(10, 50),
-                weight=random.randint(1, 10),
-            )
+            graph.add_edge(u + i, v + matching[i])
     return graph
 
 
@@ -217,49 +288,36 @@ def generate_xpander_topology_graph(
     node_count=DEFAULT_NODE_COUNT,
     servers_per_rack=DEFAULT_SERVERS_PER_RACK,
     lift=DEFAULT_LIFT_NO,
+    seed=None,
 ):
     """
     Xpander topology generated as per https://github.com/prvnkumar/xpander/blob/master/xpander/xpander.py
     """
+    rng = get_rng(seed)
     # Update parameters to create xpander topology
     num_switches = int(math.ceil(node_count / servers_per_rack))
-    switch_d = random.randint(1, num_switches - 1)
+    switch_d = rng.integers(1, num_switches).item()
     num_lifts = int(math.ceil(math.log(num_switches / (switch_d + 1), lift)))
     num_switches = int((switch_d + 1) * math.pow(lift, num_lifts))
     node_count = num_switches * servers_per_rack
     print(f"No. of switches: {num_switches}")
 
     # Create expander graph for switches
-    graph = nx.random_regular_graph(switch_d, switch_d + 1)
+    graph = nx.random_regular_graph(
+        switch_d, switch_d + 1, seed=rng.integers(2**32).item()
+    )
     nx.set_node_attributes(graph, True, "is_switch")
 
-    # Add capacity and weights to edges/nodes
-    for _, _, values in graph.edges(data=True):
-        values.update(
-            {"capacity": random.randint(10, 50), "weight": random.randint(1, 10)}
-        )
-    for _, values in graph.nodes(data=True):
-        values.update(
-            {"capacity": random.randint(10, 50), "weight": random.randint(1, 10)}
-        )
-
     # Lift graph
     for i in range(num_lifts):
-        graph = lift_graph(graph, lift)
+        graph = lift_graph(graph, lift, rng)
 
     # Add server nodes
     server_no = num_switches
     for i in list(graph.nodes()):
         for _ in range(servers_per_rack):
-            graph.add_node(
-                server_no, capacity=random.randint(10, 50), weight=random.randint(1, 10)
-            )
-            graph.add_edge(
-                i,
-                server_no,
-                capacity=random.randint(10, 50),
-                weight=random.randint(1, 10),
-            )
+            graph.add_edge(i, server_no)
             server_no += 1
 
-    return graph
+    # Add capacity and weights to edges/nodes
+    return set_random_attributes(graph, rng)
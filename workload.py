@@ -1,16 +1,57 @@
 import networkx as nx
-import random
 
+from constants import DEFAULT_LEAF_RANGE
+from substrate import get_rng
 
-DEFAULT_NODE_COUNT = random.randint(1, 10)
 
+def edge_demands(edge_demand, count, rng):
+    # A fixed demand, or one drawn per edge from an inclusive (low, high) range
+    if isinstance(edge_demand, (tuple, list)):
+        return rng.integers(edge_demand[0], edge_demand[1] + 1, count).tolist()
+    return [edge_demand] * count
 
-def generate_workload(edge_demand, node_count=DEFAULT_NODE_COUNT):
+
+def generate_workload(edge_demand, node_count=None, seed=None, workload_type="star"):
+    """
+    Workload graph of the given type. Stars have node_count leaves around a
+    "center" of weight 0, trees (random, rooted at node_0), rings and all-to-all
+    workloads have node_count nodes. Edge weights are the demands, see
+    edge_demands.
+    """
+    rng = get_rng(seed)
+    if node_count is None:
+        # Random leaf count, reproducible through the seed
+        node_count = rng.integers(
+            DEFAULT_LEAF_RANGE[0], DEFAULT_LEAF_RANGE[1] + 1
+        ).item()
     G = nx.Graph()
-    G.add_node("center", weight=0)
-    G.add_nodes_from([f"leaf_{i}" for i in range(node_count)])
-    edge_list = list()
-    for i in range(node_count):
-        edge_list.append(("center", f"leaf_{i}", edge_demand))
-    G.add_weighted_edges_from(edge_list)
+    if workload_type == "star":
+        G.add_node("center", weight=0)
+        G.add_nodes_from([f"leaf_{i}" for i in range(node_count)])
+        edges = [("center", f"leaf_{i}") for i in range(node_count)]
+    else:
+        G.add_nodes_from([f"node_{i}" for i in range(node_count)])
+        if workload_type == "tree":
+            # Every node hangs off a random earlier one
+            parents = [rng.integers(0, i).item() for i in range(1, node_count)]
+            edges = [(f"node_{p}", f"node_{i}") for i, p in enumerate(parents, 1)]
+        elif workload_type == "ring":
+            edges = [
+                (f"node_{i}", f"node_{(i + 1) % node_count}")
+                for i in range(node_count if node_count > 2 else node_count - 1)
+            ]
+        elif workload_type == "all_to_all":
+            edges = [
+                (f"node_{i}", f"node_{j}")
+                for i in range(node_count)
+                for j in range(i + 1, node_count)
+            ]
+        else:
+            raise ValueError(f"Unknown workload type {workload_type}.")
+    G.add_weighted_edges_from(
+        [
+            (u, v, demand)
+            for (u, v), demand in zip(edges, edge_demands(edge_demand, len(edges), rng))
+        ]
+    )
     return G
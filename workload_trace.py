@@ -0,0 +1,77 @@
+import csv
+import json
+import numpy as np
+
+from heapq import heappop, heappush
+
+# Departures sort before arrivals of the same time slot
+DEPARTURE = 0
+ARRIVAL = 1
+
+TRACE_FIELDS = ["start_time", "end_time", "leaf_count"]
+
+
+def read_workload_trace(path):
+    """
+    Lazily yields (start_time, end_time, leaf_count) from a CSV trace (optional
+    header, columns in that order) or a JSONL trace with one object per line.
+    """
+    with open(path, "r") as trace_file:
+        if path.endswith(".jsonl") or path.endswith(".json"):
+            for line in trace_file:
+                if line.strip():
+                    values = json.loads(line)
+                    yield tuple(int(values[field]) for field in TRACE_FIELDS)
+            return
+        for row in csv.reader(trace_file):
+            if not row or not row[0].strip().lstrip("-").isdigit():
+                # Header or blank line
+                continue
+            yield tuple(int(value) for value in row[:3])
+
+
+def scan_workload_trace(path):
+    # One streaming pass for the horizon and whether the trace is already ordered
+    horizon, count, is_sorted, previous = 0, 0, True, None
+    for workload in read_workload_trace(path):
+        horizon = max(horizon, workload[1] + 1)
+        count += 1
+        if previous and workload < previous:
+            is_sorted = False
+        previous = workload
+    return horizon, count, is_sorted
+
+
+def sorted_workload_trace(path, is_sorted=None):
+    """
+    Workloads of a trace ordered by (start_time, end_time, leaf_count). Ordered
+    traces are streamed as they are read, others go through a compact NumPy index.
+    """
+    if is_sorted is None:
+        _, _, is_sorted = scan_workload_trace(path)
+    if is_sorted:
+        yield from read_workload_trace(path)
+        return
+    index = np.fromiter(
+        (value for workload in read_workload_trace(path) for value in workload),
+        dtype=np.int64,
+    ).reshape(-1, 3)
+    for row in np.lexsort((index[:, 2], index[:, 1], index[:, 0])).tolist():
+        yield tuple(index[row].tolist())
+
+
+def workload_events(workloads):
+    """
+    Merges ordered workloads into (time, kind, workload) events. A workload
+    departs at end_time + 1, pending departures wait in a heap so only the active
+    workloads are held in memory.
+    """
+    departures = list()
+    for workload in workloads:
+        start_time = workload[0]
+        while departures and departures[0][0] <= start_time:
+            yield heappop(departures)
+        yield (start_time, ARRIVAL, workload)
+        heappush(departures, (workload[1] + 1, DEPARTURE, workload))
+    while departures:
+        yield heappop(departures)